@@ -0,0 +1,84 @@
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+def signature_hash(signature: bytes) -> bytes:
+    """
+    Băm chữ ký để làm khóa cache (tránh giữ nguyên chữ ký dài trong bộ nhớ).
+    """
+    return hashlib.sha256(signature).digest()
+
+
+class VerificationCache:
+    """
+    Bộ nhớ đệm kết quả xác minh, giới hạn kích thước (LRU) và thời gian sống (TTL).
+    Khóa: (SHA-512 digest của file, hash của chữ ký, fingerprint của public key).
+    Lưu cả kết quả thành công lẫn thất bại.
+    """
+
+    def __init__(self, max_size: int = 1024, ttl: float = 300.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, digest: bytes, signature: bytes, fingerprint: str):
+        """
+        Trả về True/False nếu đã có kết quả còn hạn, None nếu chưa có.
+        """
+        if self.max_size <= 0:
+            return None
+        key = (digest, signature_hash(signature), fingerprint)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            result, expires_at = entry
+            if expires_at <= now:
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return result
+
+    def put(self, digest: bytes, signature: bytes, fingerprint: str, result: bool):
+        if self.max_size <= 0:
+            return
+        key = (digest, signature_hash(signature), fingerprint)
+        with self._lock:
+            self._entries[key] = (result, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        """
+        Các bộ đếm phục vụ giám sát.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "hit_ratio": (self.hits / lookups) if lookups else 0.0,
+            }
@@ -4,6 +4,11 @@ import hashlib
 from flask import Flask, request, jsonify, render_template_string, send_from_directory
 from flask_cors import CORS
 from werkzeug.utils import secure_filename # Import secure_filename for security
+from bo_nho_dem_xac_minh import VerificationCache
+from hieu_nang import Profiler
+from nhat_ky_kiem_toan import AuditLog
+from kiem_soat_tiep_nhan import AdmissionControl
+from quet_toan_ven import IntegrityScrubber
 
 app = Flask(__name__)
 CORS(app)
@@ -18,25 +23,94 @@ app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 # Key: safe_filename (from uploads folder), Value: original_filename
 VERIFIED_FILES_INFO = {}
 
+# Cache kết quả xác minh theo (digest, chữ ký, fingerprint của key)
+app.config['VERIFY_CACHE_SIZE'] = int(os.environ.get('VERIFY_CACHE_SIZE', '1024'))
+app.config['VERIFY_CACHE_TTL'] = float(os.environ.get('VERIFY_CACHE_TTL', '300'))
+verify_cache = VerificationCache(max_size=app.config['VERIFY_CACHE_SIZE'], ttl=app.config['VERIFY_CACHE_TTL'])
+# Chế độ giả lập không có key thật, dùng một fingerprint cố định
+FAKE_KEY_FINGERPRINT = 'fake-rsa-sha512'
+HASH_CHUNK_SIZE = 1024 * 1024
+
+# Nhật ký kiểm toán append-only cho các sự kiện ký/xác minh (group commit, fsync theo lô).
+# Thư mục mặc định khác với chu_ky_so.py để hai ứng dụng chạy cùng thư mục không ghi chung một segment.
+audit_log = AuditLog.from_env(default_directory='audit_local')
+
+# Kiểm soát tiếp nhận: giới hạn kích thước request (Content-Length), tổng byte đang xử lý
+# và số tác vụ băm đồng thời; quá tải thì trả 503 kèm Retry-After
+admission = AdmissionControl.from_env()
+admission.init_app(app)
+
+# Profiling theo yêu cầu (PROFILER_TOKEN) và slow-request log (SLOW_REQUEST_MS); mặc định tắt
+profiler = Profiler.from_env()
+profiler.init_app(app)
+
+def report_quarantine(path, digest, target):
+    # File đã bị cách ly thì không còn được phép tải xuống
+    VERIFIED_FILES_INFO.pop(os.path.basename(path), None)
+    audit_log.record('scrub', digest, FAKE_KEY_FINGERPRINT, 'quarantined', path=path, quarantine_path=target)
+
+# Quét nền định kỳ: băm lại file trong uploads/ với tốc độ giới hạn (SCRUB_RATE_MB_S, 0 để tắt),
+# file không còn khớp SHA-512 đã ghi nhận sẽ bị chuyển vào QUARANTINE_FOLDER (thư mục riêng, khác chu_ky_so.py)
+scrubber = IntegrityScrubber.from_env(on_quarantine=report_quarantine, default_state_dir='scrub_state_local',
+                                      default_quarantine_dir='quarantine_local')
+
+def sha512_file(file_path: str) -> bytes:
+    """
+    Tính SHA-512 của file theo từng khối, không đọc toàn bộ file vào bộ nhớ.
+    """
+    h = hashlib.sha512()
+    with admission.cpu_slot(), open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            h.update(chunk)
+    return h.digest()
+
 def fake_sign_file_with_rsa_sha512(file_content: bytes) -> str:
     """
     Giả lập ký số file với RSA + SHA-512.
     """
-    sha512_hash = hashlib.sha512(file_content).digest()
-    fake_signature = base64.b64encode(sha512_hash).decode('utf-8')
+    return fake_sign_digest(hashlib.sha512(file_content).digest())
+
+def fake_sign_digest(sha512_digest: bytes) -> str:
+    """
+    Giả lập ký số khi đã có sẵn SHA-512 digest (ví dụ digest do trình duyệt tính).
+    """
+    fake_signature = base64.b64encode(sha512_digest).decode('utf-8')
+    audit_log.record('sign', sha512_digest, FAKE_KEY_FINGERPRINT, 'ok')
     return fake_signature
 
+def parse_digest(digest_hex: str) -> bytes:
+    """
+    Digest SHA-512 dạng hex (128 ký tự) do trình duyệt gửi lên -> 64 byte. Ném ValueError nếu sai.
+    """
+    digest = bytes.fromhex((digest_hex or '').strip())
+    if len(digest) != hashlib.sha512().digest_size:
+        raise ValueError('digest phải là SHA-512 (64 byte, 128 ký tự hex)')
+    return digest
+
 def fake_verify_signature(file_content: bytes, signature_b64: str) -> bool:
     """
     Giả lập xác minh chữ ký.
     """
+    return fake_verify_digest(hashlib.sha512(file_content).digest(), signature_b64)
+
+def fake_verify_digest(sha512_digest: bytes, signature_b64: str) -> bool:
+    """
+    Giả lập xác minh chữ ký khi đã có sẵn SHA-512 digest của file.
+    Kết quả (thành công hoặc thất bại) được lưu vào verify_cache.
+    """
     try:
         decoded_signature_bytes = base64.b64decode(signature_b64)
-        sha512_hash_of_original_file = hashlib.sha512(file_content).digest()
-        return sha512_hash_of_original_file == decoded_signature_bytes
     except Exception as e:
         print(f"Lỗi khi giả lập xác minh chữ ký: {e}")
         return False
+    cached = verify_cache.get(sha512_digest, decoded_signature_bytes, FAKE_KEY_FINGERPRINT)
+    if cached is not None:
+        is_valid = cached
+    else:
+        is_valid = sha512_digest == decoded_signature_bytes
+        verify_cache.put(sha512_digest, decoded_signature_bytes, FAKE_KEY_FINGERPRINT, is_valid)
+    audit_log.record('verify', sha512_digest, FAKE_KEY_FINGERPRINT, 'valid' if is_valid else 'invalid')
+    return is_valid
 
 # Định nghĩa route cho trang chủ
 @app.route('/')
@@ -44,6 +118,7 @@ def index():
     return render_template_string(HTML_TEMPLATE)
 
 @app.route('/upload-and-sign', methods=['POST'])
+@profiler.profile('upload_and_sign')
 def upload_and_sign():
     if 'file' not in request.files:
         return jsonify({"error": "Không có phần file trong yêu cầu."}), 400
@@ -56,11 +131,15 @@ def upload_and_sign():
         # Sử dụng secure_filename để đảm bảo tên file an toàn
         safe_filename = secure_filename(original_filename)
         file_path = os.path.join(app.config['UPLOAD_FOLDER'], safe_filename)
-        file_content = file.read() # Đọc nội dung file trước khi lưu
-        file.seek(0) # Đặt lại con trỏ file về đầu sau khi đọc
-        file.save(file_path)
+        with profiler.stage('save'):
+            file.save(file_path)
 
-        signature = fake_sign_file_with_rsa_sha512(file_content)
+        # Băm file đã lưu theo từng khối thay vì đọc toàn bộ file vào bộ nhớ
+        with profiler.stage('hash'):
+            sha512_digest = sha512_file(file_path)
+        scrubber.record(file_path, sha512_digest)
+        with profiler.stage('sign'):
+            signature = fake_sign_digest(sha512_digest)
 
         # Lưu thông tin file đã upload vào dictionary tạm thời
         # Lưu ý: Trong thực tế, bạn cần một cơ chế lưu trữ bền vững hơn
@@ -70,6 +149,7 @@ def upload_and_sign():
     return jsonify({"error": "Đã xảy ra lỗi không xác định khi tải file lên."}), 500
 
 @app.route('/verify-signature', methods=['POST'])
+@profiler.profile('verify_signature')
 def verify_signature():
     if 'file' not in request.files:
         return jsonify({"error": "Không có file gốc trong yêu cầu."}), 400
@@ -83,21 +163,50 @@ def verify_signature():
         return jsonify({"error": "File gốc chưa được chọn."}), 400
 
     if original_file:
-        file_content = original_file.read()
-        is_valid = fake_verify_signature(file_content, signature_b64)
-
         # Lưu file gốc tạm thời để có thể tải xuống sau khi xác minh (nếu muốn)
         # Lưu ý: Đây chỉ là ví dụ đơn giản. Trong thực tế, bạn sẽ quản lý file đã upload khác.
         original_filename = original_file.filename
         safe_filename = secure_filename(original_filename)
         file_path = os.path.join(app.config['UPLOAD_FOLDER'], safe_filename)
-        original_file.seek(0) # Reset con trỏ để có thể lưu
-        original_file.save(file_path)
+        with profiler.stage('save'):
+            original_file.save(file_path)
         VERIFIED_FILES_INFO[safe_filename] = original_filename
 
+        # Băm file đã lưu theo từng khối rồi mới xác minh (có dùng cache)
+        with profiler.stage('hash'):
+            sha512_digest = sha512_file(file_path)
+        scrubber.record(file_path, sha512_digest)
+        with profiler.stage('verify'):
+            is_valid = fake_verify_digest(sha512_digest, signature_b64)
+
         return jsonify({"is_valid": is_valid, "filename": safe_filename, "original_filename": original_filename}), 200
     return jsonify({"error": "Đã xảy ra lỗi không xác định khi xác minh chữ ký."}), 500
 
+# Các route chỉ nhận digest: file được băm trên trình duyệt, không tải lên và không lưu trên server
+@app.route('/sign-digest', methods=['POST'])
+@profiler.profile('sign_digest')
+def sign_digest():
+    try:
+        sha512_digest = parse_digest(request.form.get('digest'))
+    except ValueError as e:
+        return jsonify({"error": f"Digest không hợp lệ: {e}"}), 400
+    with profiler.stage('sign'):
+        signature = fake_sign_digest(sha512_digest)
+    return jsonify({"signature": signature}), 200
+
+@app.route('/verify-digest', methods=['POST'])
+@profiler.profile('verify_digest')
+def verify_digest():
+    if 'signature' not in request.form:
+        return jsonify({"error": "Không có chữ ký trong yêu cầu."}), 400
+    try:
+        sha512_digest = parse_digest(request.form.get('digest'))
+    except ValueError as e:
+        return jsonify({"error": f"Digest không hợp lệ: {e}"}), 400
+    with profiler.stage('verify'):
+        is_valid = fake_verify_digest(sha512_digest, request.form['signature'])
+    return jsonify({"is_valid": is_valid}), 200
+
 # New route for downloading verified original files
 # We need to store mapping of safe filename to original filename for this
 @app.route('/download-verified-file/<filename>', methods=['GET'])
@@ -118,6 +227,32 @@ def download_verified_file(filename):
     else:
         return jsonify({"error": "File không tồn tại trên server để tải xuống."}), 404
 
+@app.route('/audit/<digest_hex>', methods=['GET'])
+def audit_lookup(digest_hex):
+    try:
+        digest = bytes.fromhex(digest_hex)
+    except ValueError:
+        digest = b''
+    if len(digest) != 64:
+        return jsonify({"error": "Digest phải là chuỗi hex SHA-512."}), 400
+    return jsonify({"digest": digest_hex.lower(), "events": audit_log.lookup(digest)}), 200
+
+@app.route('/audit-stats', methods=['GET'])
+def audit_stats():
+    return jsonify(audit_log.stats()), 200
+
+@app.route('/admission-stats', methods=['GET'])
+def admission_stats():
+    return jsonify(admission.stats()), 200
+
+@app.route('/verify-cache-stats', methods=['GET'])
+def verify_cache_stats():
+    return jsonify(verify_cache.stats()), 200
+
+@app.route('/scrub-stats', methods=['GET'])
+def scrub_stats():
+    return jsonify(scrubber.stats()), 200
+
 HTML_TEMPLATE = """
 <!DOCTYPE html>
 <html lang="vi">
@@ -215,6 +350,13 @@ HTML_TEMPLATE = """
             word-break: break-all; /* Để xử lý tên file dài */
         }
 
+        .digest-only-option {
+            display: block;
+            margin-top: 12px;
+            font-size: 0.9em;
+            color: #555;
+        }
+
         button {
             background-color: #28a745;
             color: white;
@@ -340,6 +482,11 @@ HTML_TEMPLATE = """
                     <span id="fileNameDisplay">Chưa có file nào được chọn</span>
                 </div>
 
+                <label class="digest-only-option">
+                    <input type="checkbox" id="signDigestOnly">
+                    Chỉ gửi mã băm SHA-512 (file được băm trên trình duyệt, không tải lên server)
+                </label>
+
                 <button id="uploadButton">Gửi và ký số</button>
 
                 <div class="result-box">
@@ -375,6 +522,10 @@ HTML_TEMPLATE = """
                     <p><strong>Chữ ký đọc được (base64):</strong></p>
                     <textarea id="parsedSignatureOutput" rows="3" readonly placeholder="Chữ ký sẽ hiển thị ở đây sau khi bạn chọn file .sig"></textarea>
                 </div>
+                <label class="digest-only-option">
+                    <input type="checkbox" id="verifyDigestOnly">
+                    Chỉ gửi mã băm SHA-512 (file được băm trên trình duyệt, không tải lên server)
+                </label>
                 <button id="verifyButton">Xác minh chữ ký</button>
                 <p id="verifyMessage" class="message"></p>
                 <div class="footer-links">
@@ -385,6 +536,27 @@ HTML_TEMPLATE = """
     </div>
 
     <script>
+        // Băm file trong Web Worker (không chặn giao diện), trả về digest SHA-512 dạng hex
+        function hashFileInWorker(file, onProgress) {
+            return new Promise((resolve, reject) => {
+                const worker = new Worker('/static/hash_worker.js');
+                worker.onmessage = (event) => {
+                    const msg = event.data;
+                    if (msg.type === 'progress') {
+                        onProgress(msg.loaded, msg.total);
+                        return;
+                    }
+                    worker.terminate();
+                    msg.type === 'done' ? resolve(msg.digest) : reject(new Error(msg.message));
+                };
+                worker.onerror = (event) => {
+                    worker.terminate();
+                    reject(new Error(event.message));
+                };
+                worker.postMessage({ file });
+            });
+        }
+
         document.addEventListener('DOMContentLoaded', () => {
             // Elements for Upload and Sign
             const fileInput = document.getElementById('fileInput');
@@ -404,6 +576,8 @@ HTML_TEMPLATE = """
             const verifyButton = document.getElementById('verifyButton');
             const verifyMessage = document.getElementById('verifyMessage');
             const downloadVerifiedFile = document.getElementById('downloadVerifiedFile'); // Link tải file gốc đã xác minh
+            const signDigestOnly = document.getElementById('signDigestOnly');
+            const verifyDigestOnly = document.getElementById('verifyDigestOnly');
 
             let selectedFileForUpload = null;
             let currentSignatureText = null;
@@ -463,13 +637,26 @@ HTML_TEMPLATE = """
                 downloadVerifiedFile.style.display = 'none'; // Ẩn link tải file đã giải mã
 
                 const formData = new FormData();
-                formData.append('file', selectedFileForUpload);
 
                 try {
-                    const response = await fetch('/upload-and-sign', {
-                        method: 'POST',
-                        body: formData
-                    });
+                    let response;
+                    if (signDigestOnly.checked) {
+                        // Chỉ gửi digest: file không rời khỏi trình duyệt
+                        const digest = await hashFileInWorker(selectedFileForUpload, (loaded, total) => {
+                            messageOutput.textContent = `Đang băm file trên trình duyệt... ${total ? Math.floor(loaded * 100 / total) : 100}%`;
+                        });
+                        formData.append('digest', digest);
+                        response = await fetch('/sign-digest', {
+                            method: 'POST',
+                            body: formData
+                        });
+                    } else {
+                        formData.append('file', selectedFileForUpload);
+                        response = await fetch('/upload-and-sign', {
+                            method: 'POST',
+                            body: formData
+                        });
+                    }
 
                     const data = await response.json();
 
@@ -482,10 +669,12 @@ HTML_TEMPLATE = """
                         messageOutput.classList.add('success');
                         messageOutput.classList.remove('error');
 
-                        // Display download link for the original file after signing
-                        downloadOriginalFileAfterSign.href = `/download-verified-file/${encodeURIComponent(safeFilenameAfterSign)}`;
-                        downloadOriginalFileAfterSign.download = data.original_filename; // Use original name for download
-                        downloadOriginalFileAfterSign.style.display = 'inline-block';
+                        // Display download link for the original file after signing (chỉ khi file đã được tải lên)
+                        if (safeFilenameAfterSign) {
+                            downloadOriginalFileAfterSign.href = `/download-verified-file/${encodeURIComponent(safeFilenameAfterSign)}`;
+                            downloadOriginalFileAfterSign.download = data.original_filename; // Use original name for download
+                            downloadOriginalFileAfterSign.style.display = 'inline-block';
+                        }
 
                         // Display download link for the signature file
                         try {
@@ -580,14 +769,27 @@ HTML_TEMPLATE = """
                     const signatureContent = e.target.result; // Chữ ký Base64 dạng string
 
                     const formData = new FormData();
-                    formData.append('file', selectedVerifyOriginalFile); // File gốc
                     formData.append('signature', signatureContent); // Nội dung chữ ký từ file .sig
 
                     try {
-                        const response = await fetch('/verify-signature', {
-                            method: 'POST',
-                            body: formData
-                        });
+                        let response;
+                        if (verifyDigestOnly.checked) {
+                            // Chỉ gửi digest của file gốc, không tải file lên
+                            const digest = await hashFileInWorker(selectedVerifyOriginalFile, (loaded, total) => {
+                                verifyMessage.textContent = `Đang băm file trên trình duyệt... ${total ? Math.floor(loaded * 100 / total) : 100}%`;
+                            });
+                            formData.append('digest', digest);
+                            response = await fetch('/verify-digest', {
+                                method: 'POST',
+                                body: formData
+                            });
+                        } else {
+                            formData.append('file', selectedVerifyOriginalFile); // File gốc
+                            response = await fetch('/verify-signature', {
+                                method: 'POST',
+                                body: formData
+                            });
+                        }
 
                         const data = await response.json();
 
@@ -597,12 +799,14 @@ HTML_TEMPLATE = """
                                 verifyMessage.classList.add('valid');
                                 verifyMessage.classList.remove('invalid', 'pending', 'error');
 
-                                // Hiển thị link tải file gốc đã xác minh
+                                // Hiển thị link tải file gốc đã xác minh (chỉ khi file đã được tải lên)
                                 safeFilenameAfterVerify = data.filename;
-                                const originalFileNameForDownload = data.original_filename; // Use original name from server
-                                downloadVerifiedFile.href = `/download-verified-file/${encodeURIComponent(safeFilenameAfterVerify)}`;
-                                downloadVerifiedFile.style.display = 'inline-block';
-                                downloadVerifiedFile.download = originalFileNameForDownload; // Tên file khi tải về
+                                if (safeFilenameAfterVerify) {
+                                    const originalFileNameForDownload = data.original_filename; // Use original name from server
+                                    downloadVerifiedFile.href = `/download-verified-file/${encodeURIComponent(safeFilenameAfterVerify)}`;
+                                    downloadVerifiedFile.style.display = 'inline-block';
+                                    downloadVerifiedFile.download = originalFileNameForDownload; // Tên file khi tải về
+                                }
                             } else {
                                 verifyMessage.textContent = 'Chữ ký không hợp lệ! File có thể đã bị thay đổi hoặc chữ ký không đúng.';
                                 verifyMessage.classList.add('invalid');
@@ -639,4 +843,7 @@ HTML_TEMPLATE = """
 
 
 if __name__ == '__main__':
+    # Với debug=True, reloader chạy ứng dụng trong tiến trình con; chỉ tiến trình đó mới quét
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        scrubber.start()
     app.run(debug=True, port=5000)
\ No newline at end of file
@@ -1,8 +1,19 @@
-from flask import Flask, request, render_template_string
-import os, hashlib, base64
+from flask import Flask, request, render_template_string, jsonify, make_response
+import os, hashlib, base64, tempfile
+from urllib.parse import quote, unquote
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from requests.adapters import HTTPAdapter
+from werkzeug.utils import secure_filename
 from cryptography.hazmat.primitives import hashes, serialization
-from cryptography.hazmat.primitives.asymmetric import rsa, padding
+from cryptography.hazmat.primitives.asymmetric import rsa, padding, ec, ed25519, utils
 from cryptography.exceptions import InvalidSignature
+from bo_nho_dem_xac_minh import VerificationCache
+from hieu_nang import Profiler
+from nhat_ky_kiem_toan import AuditLog
+from kiem_soat_tiep_nhan import AdmissionControl, Overloaded
+from quet_toan_ven import IntegrityScrubber
+from thu_muc_khoa import KeyDirectory, pem_fingerprint
 
 app = Flask(__name__)
 UPLOAD_FOLDER = "uploads"
@@ -10,6 +21,38 @@ RECEIVED_FOLDER = "received"
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 os.makedirs(RECEIVED_FOLDER, exist_ok=True)
 
+# Cache kết quả xác minh (kích thước và TTL có thể cấu hình qua biến môi trường)
+VERIFY_CACHE_SIZE = int(os.environ.get("VERIFY_CACHE_SIZE", "1024"))
+VERIFY_CACHE_TTL = float(os.environ.get("VERIFY_CACHE_TTL", "300"))
+verify_cache = VerificationCache(max_size=VERIFY_CACHE_SIZE, ttl=VERIFY_CACHE_TTL)
+HASH_CHUNK_SIZE = 1024 * 1024
+
+# Đẩy file trực tiếp sang máy nhận (máy B), ví dụ RECEIVER_URL=http://192.168.1.20:5000
+RECEIVER_URL = os.environ.get("RECEIVER_URL", "").rstrip("/")
+PUSH_WORKERS = int(os.environ.get("PUSH_WORKERS", "4"))
+PUSH_TIMEOUT = float(os.environ.get("PUSH_TIMEOUT", "300"))
+# Một session dùng chung để tái sử dụng kết nối tới máy nhận giữa các lần đẩy
+push_session = requests.Session()
+push_session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=PUSH_WORKERS))
+push_session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=PUSH_WORKERS))
+push_executor = ThreadPoolExecutor(max_workers=PUSH_WORKERS)
+
+# Nhật ký kiểm toán các lần ký/xác minh (thư mục AUDIT_DIR, mặc định "audit")
+audit_log = AuditLog.from_env()
+
+# Công cụ đo hiệu năng, chỉ bật khi đặt PROFILER_TOKEN hoặc SLOW_REQUEST_MS
+profiler = Profiler.from_env()
+profiler.init_app(app)
+
+# Giới hạn kích thước request, tổng byte đang xử lý và số tác vụ băm/ký đồng thời
+admission = AdmissionControl.from_env()
+
+def report_quarantine(path, digest, target):
+    audit_log.record("scrub", digest, None, "quarantined", path=path, quarantine_path=target)
+
+# Quét nền: băm lại tệp đã lưu, cách ly tệp không còn khớp SHA-512 (SCRUB_RATE_MB_S=0 để tắt)
+scrubber = IntegrityScrubber.from_env(on_quarantine=report_quarantine)
+
 # Khởi tạo RSA key pair (Chỉ tạo một lần khi ứng dụng khởi động)
 private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
 public_key = private_key.public_key()
@@ -18,6 +61,231 @@ public_pem = public_key.public_bytes(
     format=serialization.PublicFormat.SubjectPublicKeyInfo
 ).decode()
 
+# Các thuật toán ký được hỗ trợ. Chữ ký có dạng "<thuật toán>:<base64>", riêng RSA PKCS#1 v1.5
+# (mặc định) vẫn là base64 trần như định dạng cũ để bên nhận cũ giải mã được.
+ALGORITHM_RSA_PKCS1V15 = "rsa-pkcs1v15"
+ALGORITHM_RSA_PSS = "rsa-pss"
+ALGORITHM_ECDSA_P256 = "ecdsa-p256"
+ALGORITHM_ED25519 = "ed25519"
+DEFAULT_ALGORITHM = ALGORITHM_RSA_PKCS1V15
+ALGORITHM_LABELS = {
+    ALGORITHM_RSA_PKCS1V15: "RSA-2048 PKCS#1 v1.5",
+    ALGORITHM_RSA_PSS: "RSA-2048 PSS",
+    ALGORITHM_ECDSA_P256: "ECDSA P-256",
+    ALGORITHM_ED25519: "Ed25519",
+}
+ALGORITHM_KEY_TYPES = {
+    ALGORITHM_RSA_PKCS1V15: rsa.RSAPublicKey,
+    ALGORITHM_RSA_PSS: rsa.RSAPublicKey,
+    ALGORITHM_ECDSA_P256: ec.EllipticCurvePublicKey,
+    ALGORITHM_ED25519: ed25519.Ed25519PublicKey,
+}
+
+def public_key_pem(key):
+    return key.public_key().public_bytes(
+        encoding=serialization.Encoding.PEM,
+        format=serialization.PublicFormat.SubjectPublicKeyInfo
+    ).decode()
+
+# Kho khóa: mỗi thuật toán một private key (hai chế độ RSA dùng chung khóa RSA ở trên)
+ec_private_key = ec.generate_private_key(ec.SECP256R1())
+ed25519_private_key = ed25519.Ed25519PrivateKey.generate()
+KEY_STORE = {
+    ALGORITHM_RSA_PKCS1V15: (private_key, public_pem),
+    ALGORITHM_RSA_PSS: (private_key, public_pem),
+    ALGORITHM_ECDSA_P256: (ec_private_key, public_key_pem(ec_private_key)),
+    ALGORITHM_ED25519: (ed25519_private_key, public_key_pem(ed25519_private_key)),
+}
+
+# Thư mục public key theo key ID: công bố khóa của máy này tại /keys và tra khóa của máy gửi
+# (nạp từ KEY_DIRECTORY_URL, ví dụ http://<máy A>:5000/keys) để người nhận không phải dán PEM
+KEY_DIRECTORY_MAX_AGE = int(os.environ.get("KEY_DIRECTORY_MAX_AGE", "300"))
+key_directory = KeyDirectory.from_env()
+for _algorithm, (_, _pem) in KEY_STORE.items():
+    key_directory.add_local(_pem, _algorithm)
+
+# Public key của các máy gửi được tin cậy sẵn (một file PEM, có thể chứa nhiều khóa).
+# /ingest chỉ nhận tệp ký bằng khóa tra được trong key_directory, không bao giờ dùng khóa do bên gửi tự đính kèm.
+TRUSTED_KEYS_FILE = os.environ.get("TRUSTED_KEYS_FILE", "")
+if TRUSTED_KEYS_FILE:
+    with open(TRUSTED_KEYS_FILE, encoding="utf-8") as _f:
+        for _block in _f.read().split("-----END PUBLIC KEY-----")[:-1]:
+            _pem = _block.strip() + "\n-----END PUBLIC KEY-----\n"
+            _key = serialization.load_pem_public_key(_pem.encode())
+            key_directory.add_trusted(_pem, [a for a, t in ALGORITHM_KEY_TYPES.items() if isinstance(_key, t)])
+
+def sign_digest(algorithm, digest):
+    """
+    Ký SHA-512 digest của tệp bằng khóa của thuật toán đã chọn, trả về chữ ký dạng "<thuật toán>:<base64>"
+    (base64 trần với RSA PKCS#1 v1.5).
+    """
+    key = KEY_STORE[algorithm][0]
+    with admission.cpu_slot():
+        if algorithm == ALGORITHM_RSA_PKCS1V15:
+            # Giữ nguyên cách ký cũ để chữ ký tương thích với các bên nhận hiện có
+            signature = key.sign(digest, padding.PKCS1v15(), hashes.SHA512())
+        elif algorithm == ALGORITHM_RSA_PSS:
+            signature = key.sign(
+                digest,
+                padding.PSS(mgf=padding.MGF1(hashes.SHA512()), salt_length=padding.PSS.DIGEST_LENGTH),
+                utils.Prehashed(hashes.SHA512())
+            )
+        elif algorithm == ALGORITHM_ECDSA_P256:
+            signature = key.sign(digest, ec.ECDSA(utils.Prehashed(hashes.SHA512())))
+        else:
+            signature = key.sign(digest)
+    audit_log.record("sign", digest, key_id(KEY_STORE[algorithm][1]), "ok", algorithm=algorithm)
+    signature_b64 = base64.b64encode(signature).decode()
+    if algorithm == ALGORITHM_RSA_PKCS1V15:
+        return signature_b64
+    return f"{algorithm}:{signature_b64}"
+
+def parse_signature(signature_text):
+    """
+    Tách chữ ký thành (thuật toán, bytes). Ném ValueError nếu thuật toán lạ hoặc không phải Base64.
+    Khoảng trắng/xuống dòng bên trong bị bỏ qua (chữ ký dán qua email, chat thường bị ngắt dòng).
+    """
+    signature_text = "".join(signature_text.split())
+    algorithm, sep, encoded = signature_text.partition(":")
+    if not sep:
+        algorithm, encoded = DEFAULT_ALGORITHM, signature_text
+    if algorithm not in ALGORITHM_LABELS:
+        raise ValueError(f"thuật toán '{algorithm}' không được hỗ trợ")
+    return algorithm, base64.b64decode(encoded, validate=True)
+
+def verify_digest(key, algorithm, signature, digest):
+    """
+    Xác minh chữ ký theo thuật toán ghi trong chữ ký. Ném InvalidSignature nếu không khớp,
+    ValueError nếu public key không đúng loại với thuật toán.
+    """
+    if not isinstance(key, ALGORITHM_KEY_TYPES[algorithm]):
+        raise ValueError(f"public key không dùng được cho thuật toán {ALGORITHM_LABELS[algorithm]}")
+    if algorithm == ALGORITHM_RSA_PKCS1V15:
+        key.verify(signature, digest, padding.PKCS1v15(), hashes.SHA512())
+    elif algorithm == ALGORITHM_RSA_PSS:
+        key.verify(
+            signature,
+            digest,
+            padding.PSS(mgf=padding.MGF1(hashes.SHA512()), salt_length=padding.PSS.DIGEST_LENGTH),
+            utils.Prehashed(hashes.SHA512())
+        )
+    elif algorithm == ALGORITHM_ECDSA_P256:
+        if not isinstance(key.curve, ec.SECP256R1):
+            raise ValueError("public key ECDSA phải dùng đường cong P-256")
+        key.verify(signature, digest, ec.ECDSA(utils.Prehashed(hashes.SHA512())))
+    else:
+        key.verify(signature, digest)
+
+def sha512_file(filepath):
+    """
+    Tính SHA-512 của tệp theo từng khối, không đọc toàn bộ tệp vào bộ nhớ.
+    """
+    h = hashlib.sha512()
+    with admission.cpu_slot(), open(filepath, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            h.update(chunk)
+    return h.digest()
+
+def key_fingerprint(pem):
+    """
+    Fingerprint của public key: SHA-256 của nội dung PEM đã bỏ khoảng trắng.
+    """
+    return pem_fingerprint(pem)
+
+def key_id(pem):
+    """
+    Mã định danh ngắn của public key (16 ký tự hex đầu của fingerprint).
+    """
+    return key_fingerprint(pem)[:16]
+
+def check_signature(digest, algorithm, signature, pubkey_pem=None, kid=None):
+    """
+    Xác minh chữ ký với public key theo key ID (tra trong key_directory, không cần parse lại PEM)
+    hoặc, chỉ khi không có key ID, public key PEM; dùng verify_cache cho các bộ (digest, chữ ký, key) đã gặp.
+    Trả về True/False; ném ValueError nếu public key không hợp lệ hoặc không tìm thấy key ID.
+    """
+    if kid:
+        # Đã nêu key ID thì key ID phải tra được, không âm thầm quay về PEM đi kèm
+        entry = key_directory.resolve(kid)
+        if entry is None:
+            raise ValueError(f"không tìm thấy public key có key ID '{kid}' trong thư mục khóa")
+        if algorithm not in entry.algorithms:
+            raise ValueError(f"key ID '{kid}' không dùng cho thuật toán {ALGORITHM_LABELS[algorithm]}")
+        fingerprint, public_key = entry.fingerprint, entry.public_key
+    elif pubkey_pem:
+        fingerprint, public_key = key_fingerprint(pubkey_pem), None
+    else:
+        raise ValueError("thiếu public key hoặc key ID")
+    cache_signature = algorithm.encode() + b":" + signature
+    cached = verify_cache.get(digest, cache_signature, fingerprint)
+    if cached is not None:
+        audit_log.record("verify", digest, fingerprint[:16], "valid" if cached else "invalid", algorithm=algorithm)
+        return cached
+
+    if public_key is None:
+        with profiler.stage("load_key"):
+            public_key = serialization.load_pem_public_key(pubkey_pem.encode())
+    try:
+        with profiler.stage("verify"), admission.cpu_slot():
+            verify_digest(public_key, algorithm, signature, digest)
+    except InvalidSignature:
+        verify_cache.put(digest, cache_signature, fingerprint, False)
+        audit_log.record("verify", digest, fingerprint[:16], "invalid", algorithm=algorithm)
+        return False
+    verify_cache.put(digest, cache_signature, fingerprint, True)
+    audit_log.record("verify", digest, fingerprint[:16], "valid", algorithm=algorithm)
+    return True
+
+def push_file(filename, algorithm):
+    """
+    Ký một tệp trong UPLOAD_FOLDER rồi truyền trực tiếp (dạng luồng) tới /ingest của máy nhận.
+    Chữ ký và key ID đi kèm trong header; máy nhận tự tra public key theo key ID (TRUSTED_KEYS_FILE
+    hoặc thư mục khóa /keys của máy này). Trả về kết quả JSON của máy nhận.
+    """
+    filepath = os.path.join(UPLOAD_FOLDER, filename)
+    signature = sign_digest(algorithm, sha512_file(filepath))
+    headers = {
+        "Content-Type": "application/octet-stream",
+        "X-File-Name": quote(filename),
+        "X-Signature": signature,
+        "X-Key-Id": key_id(KEY_STORE[algorithm][1]),
+    }
+    with open(filepath, "rb") as f:
+        response = push_session.post(RECEIVER_URL + "/ingest", data=f, headers=headers, timeout=PUSH_TIMEOUT)
+    result = response.json()
+    result["status_code"] = response.status_code
+    return result
+
+def store_received(partial_path, filename):
+    """
+    Chuyển tệp tạm vào RECEIVED_FOLDER mà không ghi đè tệp đã có: nếu trùng tên thì thêm hậu tố
+    "-1", "-2", ... Trả về tên tệp đã dùng.
+    """
+    os.chmod(partial_path, 0o644)  # mkstemp tạo tệp chỉ chủ sở hữu đọc được
+    stem, ext = os.path.splitext(filename)
+    candidate, n = filename, 0
+    while True:
+        try:
+            # link() thất bại nếu tên đã tồn tại, tránh kiểm tra rồi mới đổi tên (race)
+            os.link(partial_path, os.path.join(RECEIVED_FOLDER, candidate))
+        except FileExistsError:
+            n += 1
+            candidate = f"{stem}-{n}{ext}"
+            continue
+        os.remove(partial_path)
+        return candidate
+
+def parse_digest(digest_hex):
+    """
+    Digest SHA-512 do trình duyệt gửi lên (chuỗi hex 128 ký tự) -> 64 byte. Ném ValueError nếu sai định dạng.
+    """
+    digest = bytes.fromhex((digest_hex or "").strip())
+    if len(digest) != hashlib.sha512().digest_size:
+        raise ValueError("digest phải là SHA-512 (64 byte, 128 ký tự hex)")
+    return digest
+
+MISMATCH_MESSAGE = "❌ Xác minh thất bại: Chữ ký không khớp với dữ liệu hoặc public key. File có thể đã bị thay đổi hoặc chữ ký/public key không đúng."
+
 # HTML Giao diện chính (có cải tiến để tích hợp Peer-to-Peer Web Sharing và 2 cột)
 HTML = """
 <!DOCTYPE html>
@@ -87,7 +355,7 @@ HTML = """
                     <a href="https://wormhole.app/" target="_blank" class="text-blue-600 hover:underline">Wormhole.app</a>.
                     Gửi <strong class="text-green-700">chữ ký số</strong>, và <strong class="text-green-700">public key của bạn</strong> cho người nhận qua một kênh riêng (email, tin nhắn, v.v.).
                 </p>
-                <form method="POST" enctype="multipart/form-data" action="/sign_and_get_details" class="space-y-4">
+                <form method="POST" enctype="multipart/form-data" action="/sign_and_get_details" id="sign_form" class="space-y-4">
                     <div>
                         <label for="file_to_sign" class="file-input-label">
                             Chọn tệp để ký
@@ -95,13 +363,26 @@ HTML = """
                         </label>
                         <input type="file" name="file" id="file_to_sign" class="hidden" required onchange="document.getElementById('file_to_sign_name').innerText = this.files[0].name || ''">
                     </div>
+                    <div>
+                        <label for="algorithm" class="block text-sm font-medium text-gray-700 mb-1">Thuật toán ký:</label>
+                        <select name="algorithm" id="algorithm" class="w-full border border-gray-300 p-2 rounded-md bg-white">
+                            <option value="rsa-pkcs1v15">RSA-2048 PKCS#1 v1.5 (mặc định)</option>
+                            <option value="rsa-pss">RSA-2048 PSS</option>
+                            <option value="ecdsa-p256">ECDSA P-256 (nhanh, chữ ký 64-72 byte)</option>
+                            <option value="ed25519">Ed25519 (nhanh nhất, chữ ký 64 byte)</option>
+                        </select>
+                    </div>
+                    <label class="flex items-center gap-2 text-sm text-gray-700">
+                        <input type="checkbox" id="sign_digest_only">
+                        Chỉ gửi mã băm SHA-512 (tệp được băm trên trình duyệt, không tải lên server)
+                    </label>
                     <button type="submit" class="w-full bg-green-600 text-white px-5 py-2.5 rounded-md hover:bg-green-700 focus:outline-none focus:ring-2 focus:ring-green-500 focus:ring-offset-2 transition-colors duration-200">
                         Ký file và nhận thông tin
                     </button>
                 </form>
                 {% if signed_data %}
                 <div class="mt-6 p-4 bg-gray-100 rounded-lg border border-gray-200 space-y-4">
-                    <p class="text-lg font-semibold text-gray-800">Thông tin sau khi ký:</p>
+                    <p class="text-lg font-semibold text-gray-800">Thông tin sau khi ký ({{ signed_data.algorithm }}):</p>
                     <div>
                         <label class="block text-sm font-medium text-gray-700 mb-1">Chữ ký số (Base64):</label>
                         <textarea readonly class="w-full border border-gray-300 p-2 rounded-md bg-white text-gray-800 text-xs font-mono resize-y" rows="4" onclick="this.select()">{{ signed_data.signature }}</textarea>
@@ -116,11 +397,50 @@ HTML = """
                             Sao chép Public Key
                         </button>
                     </div>
+                    <div>
+                        <label class="block text-sm font-medium text-gray-700 mb-1">Key ID (người nhận đã nạp thư mục khóa /keys có thể dùng thay cho Public Key):</label>
+                        <input readonly value="{{ signed_data.key_id }}" class="w-full border border-gray-300 p-2 rounded-md bg-white text-gray-800 text-xs font-mono" onclick="this.select()">
+                    </div>
+                    {% if receiver_url %}
+                    <form method="POST" action="/push">
+                        <input type="hidden" name="filename" value="{{ signed_data.filename }}">
+                        <input type="hidden" name="algorithm" value="{{ signed_data.algorithm_id }}">
+                        <button type="submit" class="w-full bg-green-600 text-white px-5 py-2.5 rounded-md hover:bg-green-700 focus:outline-none focus:ring-2 focus:ring-green-500 focus:ring-offset-2 transition-colors duration-200">
+                            Gửi trực tiếp tới máy nhận ({{ receiver_url }})
+                        </button>
+                    </form>
+                    {% else %}
                     <p class="text-sm text-red-700 font-semibold mt-4">
                         ⚠️ Quan trọng: Hãy tự chia sẻ tệp gốc đã ký qua một dịch vụ chia sẻ trực tiếp và gửi Chữ ký số và Public Key trên cho người nhận.
                     </p>
+                    {% endif %}
                 </div>
                 {% endif %}
+                <div id="client_signed_data" class="hidden mt-6 p-4 bg-gray-100 rounded-lg border border-gray-200 space-y-4">
+                    <p class="text-lg font-semibold text-gray-800">Thông tin sau khi ký (<span id="client_algorithm"></span>):</p>
+                    <div>
+                        <label class="block text-sm font-medium text-gray-700 mb-1">Chữ ký số (Base64):</label>
+                        <textarea readonly id="client_signature" class="w-full border border-gray-300 p-2 rounded-md bg-white text-gray-800 text-xs font-mono resize-y" rows="4" onclick="this.select()"></textarea>
+                        <button onclick="navigator.clipboard.writeText(this.previousElementSibling.value)" class="mt-2 bg-blue-500 text-white px-3 py-1.5 rounded-md hover:bg-blue-600 focus:outline-none focus:ring-2 focus:ring-blue-500 focus:ring-offset-2 transition-colors duration-200 text-sm">
+                            Sao chép Chữ ký
+                        </button>
+                    </div>
+                    <div>
+                        <label class="block text-sm font-medium text-gray-700 mb-1">Public Key (PEM):</label>
+                        <textarea readonly id="client_public_key" class="w-full border border-gray-300 p-2 rounded-md bg-white text-gray-800 text-xs font-mono resize-y" rows="8" onclick="this.select()"></textarea>
+                        <button onclick="navigator.clipboard.writeText(this.previousElementSibling.value)" class="mt-2 bg-blue-500 text-white px-3 py-1.5 rounded-md hover:bg-blue-600 focus:outline-none focus:ring-2 focus:ring-blue-500 focus:ring-offset-2 transition-colors duration-200 text-sm">
+                            Sao chép Public Key
+                        </button>
+                    </div>
+                    <div>
+                        <label class="block text-sm font-medium text-gray-700 mb-1">Key ID (người nhận đã nạp thư mục khóa /keys có thể dùng thay cho Public Key):</label>
+                        <input readonly id="client_key_id" class="w-full border border-gray-300 p-2 rounded-md bg-white text-gray-800 text-xs font-mono" onclick="this.select()">
+                    </div>
+                    <p class="text-sm text-red-700 font-semibold mt-4">
+                        ⚠️ Quan trọng: Tệp gốc không được tải lên server, hãy tự chia sẻ tệp gốc và gửi Chữ ký số và Public Key trên cho người nhận.
+                    </p>
+                </div>
+                <p id="client_sent_message" class="message-box hidden"></p>
                 {% if sent_message %}
                 <p class="message-box {% if 'Lỗi' in sent_message %}message-error{% else %}message-success{% endif %}">
                     {{ sent_message }}
@@ -134,9 +454,9 @@ HTML = """
                 </h2>
                 <p class="text-sm text-gray-700 mb-4">
                     Người nhận cần tải tệp gốc từ dịch vụ chia sẻ trực tiếp mà người gửi đã sử dụng.
-                    Sau đó, dán chữ ký số và public key được cung cấp bởi người gửi vào đây.
+                    Sau đó, dán chữ ký số và public key (hoặc key ID) được cung cấp bởi người gửi vào đây.
                 </p>
-                <form method="POST" enctype="multipart/form-data" action="/receive" class="space-y-4">
+                <form method="POST" enctype="multipart/form-data" action="/receive" id="receive_form" class="space-y-4">
                     <div>
                         <label for="file_receive" class="file-input-label">
                             Chọn tệp đã nhận (từ dịch vụ chia sẻ)
@@ -145,11 +465,17 @@ HTML = """
                         <input type="file" name="file" id="file_receive" class="hidden" required onchange="document.getElementById('file_receive_name').innerText = this.files[0].name || ''">
                     </div>
                     <textarea name="signature" placeholder="Dán chữ ký (base64) từ người gửi" class="w-full border border-gray-300 p-3 rounded-md focus:ring-purple-500 focus:border-purple-500" rows="4" required></textarea>
-                    <textarea name="pubkey" placeholder="Dán public key (PEM) của người gửi" class="w-full border border-gray-300 p-3 rounded-md focus:ring-purple-500 focus:border-purple-500" rows="6" required></textarea>
+                    <textarea name="pubkey" placeholder="Dán public key (PEM) của người gửi (có thể bỏ trống nếu nhập key ID)" class="w-full border border-gray-300 p-3 rounded-md focus:ring-purple-500 focus:border-purple-500" rows="6"></textarea>
+                    <input type="text" name="key_id" placeholder="Hoặc nhập key ID của người gửi (tra trong thư mục khóa KEY_DIRECTORY_URL)" class="w-full border border-gray-300 p-3 rounded-md focus:ring-purple-500 focus:border-purple-500 font-mono">
+                    <label class="flex items-center gap-2 text-sm text-gray-700">
+                        <input type="checkbox" id="verify_digest_only">
+                        Chỉ gửi mã băm SHA-512 (tệp được băm trên trình duyệt, không tải lên server)
+                    </label>
                     <button type="submit" class="w-full bg-purple-600 text-white px-5 py-2.5 rounded-md hover:bg-purple-700 focus:outline-none focus:ring-2 focus:ring-purple-500 focus:ring-offset-2 transition-colors duration-200">
                         Xác minh file
                     </button>
                 </form>
+                <p id="client_verify_message" class="message-box hidden"></p>
                 {% if verify_message %}
                 <p class="message-box {% if 'thất bại' in verify_message %}message-error{% else %}message-success{% endif %}">
                     {{ verify_message }}
@@ -158,87 +484,388 @@ HTML = """
             </div>
         </div>
     </div>
+    <script>
+        // Băm tệp trong Web Worker (không chặn giao diện), trả về digest SHA-512 dạng hex
+        function hashFileInWorker(file, onProgress) {
+            return new Promise((resolve, reject) => {
+                const worker = new Worker('/static/hash_worker.js');
+                worker.onmessage = (event) => {
+                    const msg = event.data;
+                    if (msg.type === 'progress') {
+                        onProgress(msg.loaded, msg.total);
+                        return;
+                    }
+                    worker.terminate();
+                    msg.type === 'done' ? resolve(msg.digest) : reject(new Error(msg.message));
+                };
+                worker.onerror = (event) => {
+                    worker.terminate();
+                    reject(new Error(event.message));
+                };
+                worker.postMessage({ file });
+            });
+        }
+
+        function showMessage(element, text) {
+            element.textContent = text;
+            element.classList.remove('hidden', 'message-success', 'message-error');
+            element.classList.add(text.startsWith('✅') || text.startsWith('⏳') ? 'message-success' : 'message-error');
+        }
+
+        function progressText(loaded, total) {
+            return `⏳ Đang băm tệp trên trình duyệt... ${total ? Math.floor(loaded * 100 / total) : 100}%`;
+        }
+
+        document.getElementById('sign_form').addEventListener('submit', async (event) => {
+            if (!document.getElementById('sign_digest_only').checked) {
+                return;
+            }
+            event.preventDefault();
+            const form = event.target;
+            const message = document.getElementById('client_sent_message');
+            const result = document.getElementById('client_signed_data');
+            result.classList.add('hidden');
+            try {
+                const digest = await hashFileInWorker(form.file.files[0], (loaded, total) => showMessage(message, progressText(loaded, total)));
+                const body = new FormData();
+                body.append('digest', digest);
+                body.append('algorithm', form.algorithm.value);
+                const response = await fetch('/sign_digest', { method: 'POST', body });
+                const data = await response.json();
+                if (!response.ok) {
+                    showMessage(message, data.error);
+                    return;
+                }
+                document.getElementById('client_algorithm').textContent = data.algorithm;
+                document.getElementById('client_signature').value = data.signature;
+                document.getElementById('client_public_key').value = data.public_key;
+                document.getElementById('client_key_id').value = data.key_id;
+                result.classList.remove('hidden');
+                message.classList.add('hidden');
+            } catch (error) {
+                showMessage(message, `❌ Lỗi khi băm hoặc ký: ${error.message}`);
+            }
+        });
+
+        document.getElementById('receive_form').addEventListener('submit', async (event) => {
+            if (!document.getElementById('verify_digest_only').checked) {
+                return;
+            }
+            event.preventDefault();
+            const form = event.target;
+            const message = document.getElementById('client_verify_message');
+            try {
+                const digest = await hashFileInWorker(form.file.files[0], (loaded, total) => showMessage(message, progressText(loaded, total)));
+                const body = new FormData();
+                body.append('digest', digest);
+                body.append('signature', form.signature.value);
+                body.append('pubkey', form.pubkey.value);
+                body.append('key_id', form.key_id.value);
+                const response = await fetch('/verify_digest', { method: 'POST', body });
+                const data = await response.json();
+                showMessage(message, data.message || data.error);
+            } catch (error) {
+                showMessage(message, `❌ Xác minh thất bại: Lỗi khi băm tệp: ${error.message}`);
+            }
+        });
+    </script>
 </body>
 </html>
 """
 
+def render_admission_error(message, status):
+    """
+    Lỗi từ kiểm soát tiếp nhận cho form HTML: hiển thị ở cột tương ứng với route.
+    """
+    if request.path == "/receive":
+        page = render_template_string(HTML, verify_message=message)
+    else:
+        page = render_template_string(HTML, sent_message=message)
+    return make_response(page, status)
+
+admission.init_app(app, render_error=render_admission_error)
+
 @app.route("/", methods=["GET"])
 def home():
     return render_template_string(HTML)
 
 @app.route("/sign_and_get_details", methods=["POST"])
+@profiler.profile("sign_and_get_details")
 def sign_and_get_details():
     file = request.files.get("file")
+    algorithm = request.form.get("algorithm", DEFAULT_ALGORITHM)
 
     if not file:
         return render_template_string(HTML, sent_message="❌ Lỗi: Vui lòng chọn tệp để ký.")
+    if algorithm not in KEY_STORE:
+        return render_template_string(HTML, sent_message=f"❌ Lỗi: Thuật toán ký '{algorithm}' không được hỗ trợ.")
 
     filepath = os.path.join(UPLOAD_FOLDER, file.filename)
     try:
-        file.save(filepath)
+        with profiler.stage("save"):
+            file.save(filepath)
     except Exception as e:
         return render_template_string(HTML, sent_message=f"❌ Lỗi khi lưu tệp: {e}")
 
-    with open(filepath, "rb") as f:
-        data = f.read()
+    with profiler.stage("hash"):
+        digest = sha512_file(filepath)
+    scrubber.record(filepath, digest)
 
     # Tạo chữ ký
-    digest = hashlib.sha512(data).digest()
     try:
-        signature = private_key.sign(
-            digest,
-            padding.PKCS1v15(),
-            hashes.SHA512()
-        )
-        signature_b64 = base64.b64encode(signature).decode()
+        with profiler.stage("sign"):
+            signature_b64 = sign_digest(algorithm, digest)
         
         # Trả về chữ ký và public key để người dùng sao chép
         signed_data = {
+            "filename": os.path.basename(file.filename),
+            "algorithm_id": algorithm,
             "signature": signature_b64,
-            "public_key": public_pem
+            "public_key": KEY_STORE[algorithm][1],
+            "key_id": key_id(KEY_STORE[algorithm][1]),
+            "algorithm": ALGORITHM_LABELS[algorithm]
         }
-        return render_template_string(HTML, signed_data=signed_data)
+        return render_template_string(HTML, signed_data=signed_data, receiver_url=RECEIVER_URL)
 
+    except Overloaded:
+        raise
     except Exception as e:
         return render_template_string(HTML, sent_message=f"❌ Lỗi khi tạo chữ ký: {e}")
 
 @app.route("/receive", methods=["POST"])
+@profiler.profile("receive")
 def receive():
     file = request.files.get("file")
     signature_b64 = request.form.get("signature")
-    pubkey_pem = request.form.get("pubkey")
+    pubkey_pem = request.form.get("pubkey", "").strip()
+    kid = request.form.get("key_id", "").strip()
 
-    if not file or not signature_b64 or not pubkey_pem:
-        return render_template_string(HTML, verify_message="❌ Lỗi: Vui lòng cung cấp đầy đủ tệp, chữ ký và public key.")
+    if not file or not signature_b64 or not (pubkey_pem or kid):
+        return render_template_string(HTML, verify_message="❌ Lỗi: Vui lòng cung cấp đầy đủ tệp, chữ ký và public key (hoặc key ID).")
 
     filepath = os.path.join(RECEIVED_FOLDER, file.filename)
     try:
-        file.save(filepath)
+        with profiler.stage("save"):
+            file.save(filepath)
     except Exception as e:
         return render_template_string(HTML, verify_message=f"❌ Lỗi khi lưu tệp đã nhận: {e}")
 
-    with open(filepath, "rb") as f:
-        data = f.read()
-    digest = hashlib.sha512(data).digest()
+    with profiler.stage("hash"):
+        digest = sha512_file(filepath)
+    scrubber.record(filepath, digest)
     
     try:
-        signature = base64.b64decode(signature_b64)
+        algorithm, signature = parse_signature(signature_b64)
     except Exception as e:
-        return render_template_string(HTML, verify_message=f"❌ Xác minh thất bại: Chữ ký không hợp lệ (không phải Base64): {e}")
+        return render_template_string(HTML, verify_message=f"❌ Xác minh thất bại: Chữ ký không hợp lệ (sai thuật toán hoặc không phải Base64): {e}")
 
     try:
-        public_key = serialization.load_pem_public_key(pubkey_pem.encode())
         # Cố gắng xác minh chữ ký
-        public_key.verify(signature, digest, padding.PKCS1v15(), hashes.SHA512())
-        verify_msg = f"✅ Xác minh thành công! File '{file.filename}' hợp lệ và đã được lưu tại thư mục '{RECEIVED_FOLDER}'."
-    except InvalidSignature:
-        verify_msg = "❌ Xác minh thất bại: Chữ ký không khớp với dữ liệu hoặc public key. File có thể đã bị thay đổi hoặc chữ ký/public key không đúng."
+        if check_signature(digest, algorithm, signature, pubkey_pem, kid):
+            verify_msg = f"✅ Xác minh thành công! File '{file.filename}' hợp lệ và đã được lưu tại thư mục '{RECEIVED_FOLDER}'."
+        else:
+            verify_msg = MISMATCH_MESSAGE
     except ValueError as e:
         verify_msg = f"❌ Xác minh thất bại: Public key không hợp lệ (không phải định dạng PEM hoặc lỗi khác): {e}"
+    except Overloaded:
+        raise
     except Exception as e:
         verify_msg = f"❌ Xác minh thất bại: Xảy ra lỗi không xác định trong quá trình xác minh: {e}"
 
     return render_template_string(HTML, verify_message=verify_msg)
 
+@app.route("/sign_digest", methods=["POST"])
+@profiler.profile("sign_digest")
+def sign_digest_only():
+    """
+    Ký chỉ dựa trên digest SHA-512 do trình duyệt tính, tệp không được tải lên server.
+    """
+    algorithm = request.form.get("algorithm", DEFAULT_ALGORITHM)
+    try:
+        digest = parse_digest(request.form.get("digest"))
+    except ValueError as e:
+        return jsonify({"error": f"❌ Lỗi: Digest không hợp lệ: {e}"}), 400
+    if algorithm not in KEY_STORE:
+        return jsonify({"error": f"❌ Lỗi: Thuật toán ký '{algorithm}' không được hỗ trợ."}), 400
+    try:
+        with profiler.stage("sign"):
+            signature_b64 = sign_digest(algorithm, digest)
+    except Overloaded:
+        raise
+    except Exception as e:
+        return jsonify({"error": f"❌ Lỗi khi tạo chữ ký: {e}"}), 500
+    return jsonify({
+        "signature": signature_b64,
+        "public_key": KEY_STORE[algorithm][1],
+        "key_id": key_id(KEY_STORE[algorithm][1]),
+        "algorithm": ALGORITHM_LABELS[algorithm]
+    })
+
+@app.route("/verify_digest", methods=["POST"])
+@profiler.profile("verify_digest")
+def verify_digest_only():
+    """
+    Xác minh chữ ký với digest SHA-512 do trình duyệt tính, tệp không được tải lên server.
+    """
+    signature_b64 = request.form.get("signature")
+    pubkey_pem = request.form.get("pubkey", "").strip()
+    kid = request.form.get("key_id", "").strip()
+    if not signature_b64 or not (pubkey_pem or kid):
+        return jsonify({"verified": False, "message": "❌ Lỗi: Vui lòng cung cấp đầy đủ tệp, chữ ký và public key (hoặc key ID)."}), 400
+    try:
+        digest = parse_digest(request.form.get("digest"))
+    except ValueError as e:
+        return jsonify({"verified": False, "message": f"❌ Xác minh thất bại: Digest không hợp lệ: {e}"}), 400
+    try:
+        algorithm, signature = parse_signature(signature_b64)
+    except Exception as e:
+        return jsonify({"verified": False, "message": f"❌ Xác minh thất bại: Chữ ký không hợp lệ (sai thuật toán hoặc không phải Base64): {e}"}), 400
+    try:
+        verified = check_signature(digest, algorithm, signature, pubkey_pem, kid)
+    except ValueError as e:
+        return jsonify({"verified": False, "message": f"❌ Xác minh thất bại: Public key không hợp lệ (không phải định dạng PEM hoặc lỗi khác): {e}"}), 400
+    if not verified:
+        return jsonify({"verified": False, "message": MISMATCH_MESSAGE})
+    return jsonify({"verified": True, "message": "✅ Xác minh thành công! Tệp khớp với chữ ký (chỉ digest được gửi lên server)."})
+
+@app.route("/push", methods=["POST"])
+def push():
+    """
+    Đẩy một hoặc nhiều tệp đã tải lên sang máy nhận (RECEIVER_URL), chạy song song.
+    """
+    wants_json = request.accept_mimetypes.best == "application/json"
+    filenames = [os.path.basename(name) for name in request.form.getlist("filename") if name]
+    algorithm = request.form.get("algorithm", DEFAULT_ALGORITHM)
+
+    error = None
+    if not RECEIVER_URL:
+        error = "❌ Lỗi: Chưa cấu hình máy nhận (biến môi trường RECEIVER_URL)."
+    elif not filenames:
+        error = "❌ Lỗi: Vui lòng chọn tệp để gửi."
+    elif algorithm not in KEY_STORE:
+        error = f"❌ Lỗi: Thuật toán ký '{algorithm}' không được hỗ trợ."
+    else:
+        missing = [name for name in filenames if not os.path.isfile(os.path.join(UPLOAD_FOLDER, name))]
+        if missing:
+            error = f"❌ Lỗi: Không tìm thấy tệp đã tải lên: {', '.join(missing)}"
+    if error:
+        if wants_json:
+            return jsonify({"error": error}), 400
+        return render_template_string(HTML, sent_message=error)
+
+    futures = [push_executor.submit(push_file, name, algorithm) for name in filenames]
+    results = []
+    for name, future in zip(filenames, futures):
+        try:
+            results.append(future.result())
+        except Exception as e:
+            results.append({"filename": name, "verified": False, "message": f"❌ Lỗi khi gửi tệp '{name}': {e}"})
+
+    if wants_json:
+        return jsonify({"results": results})
+    failed = [r for r in results if not r.get("verified")]
+    if failed:
+        message = "❌ Lỗi khi gửi: " + " ".join(r.get("message", "") for r in failed)
+    else:
+        message = f"✅ Đã gửi và máy nhận đã xác minh {len(results)} tệp."
+    return render_template_string(HTML, sent_message=message)
+
+@app.route("/ingest", methods=["POST"])
+def ingest():
+    """
+    Nhận tệp được đẩy từ máy gửi: vừa ghi xuống đĩa vừa băm, xác minh khi nhận xong.
+    Chỉ chấp nhận key ID mà máy nhận đã tin cậy (khóa của chính máy này, TRUSTED_KEYS_FILE hoặc
+    thư mục khóa KEY_DIRECTORY_URL). Tệp chỉ được giữ lại trong RECEIVED_FOLDER nếu chữ ký hợp lệ,
+    và không ghi đè tệp đã có: trùng tên thì được lưu dưới tên mới (trả về trong "filename").
+    """
+    filename = secure_filename(unquote(request.headers.get("X-File-Name", "")))
+    signature_text = request.headers.get("X-Signature")
+    kid = request.headers.get("X-Key-Id", "").strip()
+    if not filename or not signature_text or not kid:
+        return jsonify({"filename": filename, "verified": False,
+                        "message": "❌ Lỗi: Thiếu tên tệp, chữ ký hoặc key ID."}), 400
+    try:
+        algorithm, signature = parse_signature(signature_text)
+    except Exception as e:
+        return jsonify({"filename": filename, "verified": False,
+                        "message": f"❌ Xác minh thất bại: Chữ ký không hợp lệ: {e}"}), 400
+    if key_directory.resolve(kid) is None:
+        return jsonify({"filename": filename, "verified": False,
+                        "message": f"❌ Xác minh thất bại: Key ID '{kid}' không thuộc danh sách khóa tin cậy của máy nhận."}), 403
+
+    # Tên tạm riêng cho mỗi request để các lần đẩy cùng tên không ghi chồng lên nhau
+    fd, partial_path = tempfile.mkstemp(dir=RECEIVED_FOLDER, suffix=".part")
+    h = hashlib.sha512()
+    try:
+        try:
+            with profiler.stage("receive_and_hash"), os.fdopen(fd, "wb") as f:
+                for chunk in iter(lambda: request.stream.read(HASH_CHUNK_SIZE), b""):
+                    h.update(chunk)
+                    f.write(chunk)
+        except Exception as e:
+            return jsonify({"filename": filename, "verified": False,
+                            "message": f"❌ Lỗi khi lưu tệp đã nhận: {e}"}), 500
+
+        try:
+            verified = check_signature(h.digest(), algorithm, signature, kid=kid)
+        except ValueError as e:
+            return jsonify({"filename": filename, "verified": False,
+                            "message": f"❌ Xác minh thất bại: Public key không hợp lệ: {e}"}), 400
+        if not verified:
+            return jsonify({"filename": filename, "verified": False, "message": MISMATCH_MESSAGE}), 422
+        filename = store_received(partial_path, filename)
+    finally:
+        # Mọi nhánh không giữ lại tệp (kể cả Overloaded từ cpu_slot) đều phải dọn tệp tạm
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+    scrubber.record(os.path.join(RECEIVED_FOLDER, filename), h.digest())
+    return jsonify({"filename": filename, "verified": True,
+                    "message": f"✅ Xác minh thành công! File '{filename}' hợp lệ và đã được lưu tại thư mục '{RECEIVED_FOLDER}'."})
+
+@app.route("/audit/<digest_hex>", methods=["GET"])
+def audit_lookup(digest_hex):
+    try:
+        digest = bytes.fromhex(digest_hex)
+    except ValueError:
+        digest = b""
+    if len(digest) != 64:
+        return jsonify({"error": "Digest phải là chuỗi hex SHA-512."}), 400
+    return jsonify({"digest": digest_hex.lower(), "events": audit_log.lookup(digest)})
+
+@app.route("/audit_stats", methods=["GET"])
+def audit_stats():
+    return jsonify(audit_log.stats())
+
+@app.route("/admission_stats", methods=["GET"])
+def admission_stats():
+    return jsonify(admission.stats())
+
+@app.route("/verify_cache_stats", methods=["GET"])
+def verify_cache_stats():
+    return jsonify(verify_cache.stats())
+
+@app.route("/scrub_stats", methods=["GET"])
+def scrub_stats():
+    return jsonify(scrubber.stats())
+
+@app.route("/keys", methods=["GET"])
+def keys():
+    """
+    Thư mục public key của máy này (kiểu JWKS): key ID, thuật toán và PEM.
+    Nội dung chỉ đổi khi khóa đổi nên dùng ETag mạnh; client gửi If-None-Match sẽ nhận 304.
+    """
+    body, etag = key_directory.document()
+    response = app.response_class(body, mimetype="application/json")
+    response.set_etag(etag)
+    response.cache_control.public = True
+    response.cache_control.max_age = KEY_DIRECTORY_MAX_AGE
+    return response.make_conditional(request)
+
+@app.route("/key_directory_stats", methods=["GET"])
+def key_directory_stats():
+    return jsonify(key_directory.stats())
+
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=5000)
\ No newline at end of file
+    # Cho phép chạy nhiều instance trên cùng một máy (ví dụ khi kiểm thử tải)
+    scrubber.start()
+    app.run(host="0.0.0.0", port=int(os.environ.get("PORT", "5000")))
\ No newline at end of file
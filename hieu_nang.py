@@ -0,0 +1,216 @@
+import os
+import sys
+import hmac
+import json
+import time
+import pstats
+import cProfile
+import functools
+import threading
+import contextlib
+from collections import Counter
+
+from flask import g, request, jsonify
+
+_NULL_STAGE = contextlib.nullcontext()
+
+
+class StackSampler:
+    """
+    Profiler lấy mẫu: định kỳ chụp stack của mọi luồng và đếm theo dạng "folded"
+    (a;b;c số_lần), đầu vào trực tiếp cho flamegraph.pl / speedscope.
+    """
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def write_folded(self, path: str):
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+class Profiler:
+    """
+    Công cụ đo hiệu năng bật theo yêu cầu cho các worker ký/xác minh.
+
+    - Chỉ hoạt động khi có admin token hoặc ngưỡng slow-request; nếu không,
+      profile() trả lại nguyên hàm và stage() là context rỗng (không tốn chi phí).
+    - /admin/profiler/...: bật/tắt profiler lấy mẫu, hoặc chạy cProfile cho N request kế tiếp.
+    - Slow-request log: ghi thời gian từng giai đoạn của request chậm hơn ngưỡng.
+    """
+
+    def __init__(self, admin_token=None, output_dir="profiles", slow_request_ms=None):
+        self.admin_token = admin_token
+        self.output_dir = output_dir
+        self.slow_request_ms = slow_request_ms
+        self.enabled = bool(admin_token) or slow_request_ms is not None
+        self._lock = threading.Lock()
+        self._cprofile_lock = threading.Lock()
+        self._log_lock = threading.Lock()
+        self._remaining = 0
+        self._sampler = None
+        if self.enabled:
+            os.makedirs(output_dir, exist_ok=True)
+
+    @classmethod
+    def from_env(cls):
+        slow_ms = os.environ.get("SLOW_REQUEST_MS")
+        return cls(
+            admin_token=os.environ.get("PROFILER_TOKEN") or None,
+            output_dir=os.environ.get("PROFILE_DIR", "profiles"),
+            slow_request_ms=float(slow_ms) if slow_ms else None,
+        )
+
+    def init_app(self, app):
+        if not self.enabled:
+            return
+        if self.slow_request_ms is not None:
+            app.before_request(self._start_request)
+            app.after_request(self._finish_request)
+        if self.admin_token:
+            app.add_url_rule("/admin/profiler/status", "profiler_status", self._admin(self.status), methods=["GET"])
+            app.add_url_rule("/admin/profiler/sampling/start", "profiler_sampling_start", self._admin(self.start_sampling), methods=["POST"])
+            app.add_url_rule("/admin/profiler/sampling/stop", "profiler_sampling_stop", self._admin(self.stop_sampling), methods=["POST"])
+            app.add_url_rule("/admin/profiler/next", "profiler_next", self._admin(self.profile_next), methods=["POST"])
+
+    def profile(self, name):
+        """
+        Decorator: request được đánh dấu bằng /admin/profiler/next sẽ chạy trong cProfile.
+        """
+        def decorator(func):
+            if not self.admin_token:
+                return func
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self._remaining or not self._take_one():
+                    return func(*args, **kwargs)
+                # cProfile không chạy song song được, request đến cùng lúc sẽ không được profile
+                if not self._cprofile_lock.acquire(blocking=False):
+                    with self._lock:
+                        self._remaining += 1
+                    return func(*args, **kwargs)
+                profiler = cProfile.Profile()
+                try:
+                    return profiler.runcall(func, *args, **kwargs)
+                finally:
+                    self._cprofile_lock.release()
+                    path = os.path.join(self.output_dir, f"{name}-{time.time_ns()}.prof")
+                    pstats.Stats(profiler).dump_stats(path)
+            return wrapper
+        return decorator
+
+    def stage(self, name):
+        """
+        Đo thời gian một giai đoạn (lưu file, băm, ký, xác minh...) cho slow-request log.
+        """
+        if self.slow_request_ms is None:
+            return _NULL_STAGE
+        return self._timed_stage(name)
+
+    @contextlib.contextmanager
+    def _timed_stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            stages = g.setdefault("profiler_stages", [])
+            stages.append((name, (time.perf_counter() - start) * 1000))
+
+    def _take_one(self):
+        with self._lock:
+            if self._remaining <= 0:
+                return False
+            self._remaining -= 1
+            return True
+
+    def _start_request(self):
+        g.profiler_started = time.perf_counter()
+
+    def _finish_request(self, response):
+        started = g.get("profiler_started")
+        if started is None:
+            return response
+        total_ms = (time.perf_counter() - started) * 1000
+        if total_ms >= self.slow_request_ms:
+            entry = {
+                "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "method": request.method,
+                "path": request.path,
+                "status": response.status_code,
+                "content_length": request.content_length,
+                "total_ms": round(total_ms, 3),
+                "stages": {name: round(ms, 3) for name, ms in g.get("profiler_stages", [])},
+            }
+            with self._log_lock:
+                with open(os.path.join(self.output_dir, "slow_requests.log"), "a", encoding="utf-8") as f:
+                    f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        return response
+
+    def _admin(self, view):
+        @functools.wraps(view)
+        def wrapper():
+            if not hmac.compare_digest(request.headers.get("X-Admin-Token", ""), self.admin_token):
+                return jsonify({"error": "Không có quyền truy cập."}), 403
+            return view()
+        return wrapper
+
+    def status(self):
+        return jsonify({
+            "sampling": self._sampler is not None,
+            "cprofile_remaining": self._remaining,
+            "slow_request_ms": self.slow_request_ms,
+            "output_dir": os.path.abspath(self.output_dir),
+        }), 200
+
+    def start_sampling(self):
+        interval_ms = request.args.get("interval_ms", default=5.0, type=float)
+        with self._lock:
+            if self._sampler is not None:
+                return jsonify({"error": "Profiler lấy mẫu đang chạy."}), 409
+            self._sampler = StackSampler(interval=interval_ms / 1000)
+            self._sampler.start()
+        return jsonify({"sampling": True, "interval_ms": interval_ms}), 200
+
+    def stop_sampling(self):
+        with self._lock:
+            sampler, self._sampler = self._sampler, None
+        if sampler is None:
+            return jsonify({"error": "Profiler lấy mẫu chưa được bật."}), 409
+        sampler.stop()
+        path = os.path.join(self.output_dir, f"sample-{time.strftime('%Y%m%d-%H%M%S')}.folded")
+        sampler.write_folded(path)
+        return jsonify({"path": os.path.abspath(path), "samples": sampler.samples}), 200
+
+    def profile_next(self):
+        count = request.args.get("count", default=1, type=int)
+        with self._lock:
+            self._remaining = max(0, count)
+        return jsonify({"cprofile_remaining": self._remaining}), 200
@@ -0,0 +1,131 @@
+import os
+import threading
+import contextlib
+
+from flask import g, request, jsonify
+
+
+class Overloaded(Exception):
+    """
+    Vượt ngân sách (bộ nhớ hoặc CPU) và đã chờ quá thời gian cho phép.
+    """
+
+
+class AdmissionControl:
+    """
+    Kiểm soát tiếp nhận request theo tài nguyên của mỗi tiến trình:
+
+    - Kích thước tối đa mỗi request, kiểm tra từ Content-Length trước khi đọc body (413).
+    - Tổng số byte đang xử lý (bytes in flight): request mới phải chờ trong hàng đợi
+      tối đa queue_timeout giây, quá hạn thì trả 503 kèm Retry-After.
+    - Số tác vụ băm/ký chạy đồng thời (cpu_slot), quá hạn chờ cũng trả 503.
+    """
+
+    def __init__(self, max_request_bytes, max_bytes_in_flight, cpu_slots, queue_timeout=5.0, retry_after=5):
+        self.max_request_bytes = max_request_bytes
+        self.max_bytes_in_flight = max(max_bytes_in_flight, max_request_bytes)
+        self.cpu_slots = cpu_slots
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self.bytes_in_flight = 0
+        self.cpu_busy = 0
+        self.rejected = {"too_large": 0, "length_required": 0, "memory": 0, "cpu": 0}
+        self._condition = threading.Condition()
+        self._cpu = threading.BoundedSemaphore(cpu_slots)
+        self._render_error = None
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            max_request_bytes=int(os.environ.get("MAX_REQUEST_MB", "512")) * 1024 * 1024,
+            max_bytes_in_flight=int(os.environ.get("MAX_INFLIGHT_MB", "1024")) * 1024 * 1024,
+            cpu_slots=int(os.environ.get("CPU_SLOTS", str(os.cpu_count() or 1))),
+            queue_timeout=float(os.environ.get("ADMISSION_QUEUE_TIMEOUT", "5")),
+            retry_after=int(os.environ.get("RETRY_AFTER", "5")),
+        )
+
+    def init_app(self, app, render_error=None):
+        """
+        render_error(message, status): tùy chọn, để trả lỗi dạng HTML cho form; mặc định trả JSON.
+        """
+        self._render_error = render_error
+        app.config["MAX_CONTENT_LENGTH"] = self.max_request_bytes
+        app.before_request(self._admit)
+        app.teardown_request(self._release)
+        app.register_error_handler(Overloaded, self._overloaded)
+
+    @contextlib.contextmanager
+    def cpu_slot(self):
+        """
+        Giữ một suất CPU trong lúc băm/ký/xác minh.
+        """
+        if not self._cpu.acquire(timeout=self.queue_timeout):
+            with self._condition:
+                self.rejected["cpu"] += 1
+            raise Overloaded("❌ Lỗi: Máy chủ đang bận xử lý băm/ký, vui lòng thử lại sau.")
+        with self._condition:
+            self.cpu_busy += 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self.cpu_busy -= 1
+            self._cpu.release()
+
+    def stats(self):
+        with self._condition:
+            return {
+                "bytes_in_flight": self.bytes_in_flight,
+                "max_bytes_in_flight": self.max_bytes_in_flight,
+                "max_request_bytes": self.max_request_bytes,
+                "cpu_busy": self.cpu_busy,
+                "cpu_slots": self.cpu_slots,
+                "rejected": dict(self.rejected),
+            }
+
+    def _admit(self):
+        if request.method not in ("POST", "PUT"):
+            return None
+        length = request.content_length
+        if length is None and "Transfer-Encoding" not in request.headers:
+            # Không có Content-Length lẫn Transfer-Encoding thì request không có body (ví dụ POST tới /admin/...)
+            return None
+        if length is None:
+            # Không biết trước kích thước (ví dụ chunked) thì không thể tính vào ngân sách
+            with self._condition:
+                self.rejected["length_required"] += 1
+            return self._error("❌ Lỗi: Yêu cầu phải có Content-Length.", 411)
+        if length > self.max_request_bytes:
+            with self._condition:
+                self.rejected["too_large"] += 1
+            return self._error(f"❌ Lỗi: Tệp quá lớn (tối đa {self.max_request_bytes // (1024 * 1024)} MB).", 413)
+        with self._condition:
+            admitted = self._condition.wait_for(
+                lambda: self.bytes_in_flight + length <= self.max_bytes_in_flight, timeout=self.queue_timeout
+            )
+            if not admitted:
+                self.rejected["memory"] += 1
+                return self._error("❌ Lỗi: Máy chủ đang nhận quá nhiều dữ liệu, vui lòng thử lại sau.", 503)
+            self.bytes_in_flight += length
+        g.admitted_bytes = length
+        return None
+
+    def _release(self, exc=None):
+        length = g.pop("admitted_bytes", 0)
+        if length:
+            with self._condition:
+                self.bytes_in_flight -= length
+                self._condition.notify_all()
+
+    def _overloaded(self, error):
+        return self._error(str(error), 503)
+
+    def _error(self, message, status):
+        if self._render_error is not None and request.accept_mimetypes.best == "text/html":
+            response = self._render_error(message, status)
+        else:
+            response = jsonify({"error": message})
+            response.status_code = status
+        if status == 503:
+            response.headers["Retry-After"] = str(self.retry_after)
+        return response
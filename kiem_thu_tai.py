@@ -0,0 +1,309 @@
+"""
+Kiểm thử tải đầu-cuối cho luồng truyền file từ máy A sang máy B (chu_ky_so.py).
+
+Chạy hai instance của chu_ky_so.py trên localhost (hai cổng khác nhau đóng vai
+máy A - bên gửi và máy B - bên nhận), sau đó nhiều client đồng thời lặp lại chu
+trình: ký trên A -> chuyển file + chữ ký + public key sang B -> xác minh trên B.
+
+Ví dụ:
+    python kiem_thu_tai.py --clients 8 --duration 30 --sizes 1K:5,64K:3,1M:1
+"""
+import os
+import re
+import sys
+import json
+import html
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "chu_ky_so.py")
+SIZE_UNITS = {"": 1, "B": 1, "K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+TEXTAREA_RE = re.compile(r"<textarea readonly[^>]*>(.*?)</textarea>", re.S)
+# Thông báo xác minh do server render; không dựa vào ký tự "✅" vì nó cũng có trong script của trang
+VERIFIED_RE = re.compile(r'<p class="message-box message-success">\s*✅ Xác minh thành công')
+
+
+def parse_size(text):
+    match = re.fullmatch(r"(\d+(?:\.\d+)?)([BKMG]?)", text.strip().upper())
+    if not match:
+        raise argparse.ArgumentTypeError(f"Kích thước không hợp lệ: {text}")
+    return int(float(match.group(1)) * SIZE_UNITS[match.group(2)])
+
+
+def parse_size_distribution(text):
+    """
+    "1K:5,64K:3,1M:1" -> [(1024, 5), (65536, 3), (1048576, 1)] (kích thước, trọng số).
+    """
+    distribution = []
+    for item in text.split(","):
+        size, _, weight = item.partition(":")
+        distribution.append((parse_size(size), float(weight or 1)))
+    return distribution
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+def rss_kb(pid):
+    """
+    Bộ nhớ thường trú (VmRSS, KB) của tiến trình, None nếu không đọc được (không phải Linux).
+    """
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+class Instance:
+    """
+    Một instance chu_ky_so.py chạy trong thư mục làm việc riêng (uploads/ và received/ riêng).
+    """
+
+    def __init__(self, name, port, env=None):
+        self.name = name
+        self.port = port
+        self.env = env or {}
+        self.url = f"http://127.0.0.1:{port}"
+        self.workdir = tempfile.mkdtemp(prefix=f"chu_ky_so_{name}_")
+        self.process = None
+
+    def start(self, timeout=30):
+        env = dict(os.environ, PORT=str(self.port), **self.env)
+        self.process = subprocess.Popen(
+            [sys.executable, APP_PATH],
+            cwd=self.workdir,
+            env=env,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"Instance {self.name} đã dừng (mã thoát {self.process.returncode}).")
+            try:
+                if requests.get(self.url + "/", timeout=1).ok:
+                    return
+            except requests.RequestException:
+                time.sleep(0.2)
+        raise RuntimeError(f"Instance {self.name} không sẵn sàng sau {timeout}s.")
+
+    def stop(self):
+        if self.process and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+
+class LoadTest:
+    def __init__(self, sender, receiver, distribution, clients, duration, total_cycles, sample_interval, algorithm, push):
+        self.sender = sender
+        self.receiver = receiver
+        self.distribution = distribution
+        self.clients = clients
+        self.duration = duration
+        self.total_cycles = total_cycles
+        self.sample_interval = sample_interval
+        self.algorithm = algorithm
+        # push=True: A tự đẩy file sang B qua /push -> /ingest thay vì client gửi lại file cho B
+        self.push = push
+
+        # Tạo sẵn nội dung cho mỗi kích thước; mỗi chu trình thêm tiền tố riêng để file luôn khác nhau
+        self.payloads = {size: os.urandom(size) for size, _ in distribution}
+        self.sizes = [size for size, _ in distribution]
+        self.weights = [weight for _, weight in distribution]
+
+        self._lock = threading.Lock()
+        self._counter = 0
+        self._local = threading.local()
+        self._stop = threading.Event()
+        self.results = []  # (size, sign_s, verify_s, total_s, error)
+        self.rss_samples = []  # (t, sender_kb, receiver_kb)
+
+    def _session(self):
+        if not hasattr(self._local, "session"):
+            self._local.session = requests.Session()
+        return self._local.session
+
+    def _next_id(self):
+        with self._lock:
+            if self.total_cycles is not None and self._counter >= self.total_cycles:
+                return None
+            self._counter += 1
+            return self._counter
+
+    def run_cycle(self, cycle_id):
+        session = self._session()
+        size = random.choices(self.sizes, self.weights)[0]
+        prefix = f"{cycle_id}:".encode()
+        data = prefix + self.payloads[size][len(prefix):]
+        filename = f"load_{cycle_id}.bin"
+
+        start = time.perf_counter()
+        response = session.post(
+            self.sender.url + "/sign_and_get_details",
+            files={"file": (filename, data)},
+            data={"algorithm": self.algorithm},
+        )
+        signed = time.perf_counter()
+        # Bỏ qua các ô trống dành cho chế độ chỉ gửi digest (được điền bằng JavaScript)
+        areas = [html.unescape(a) for a in TEXTAREA_RE.findall(response.text) if a.strip()]
+        if response.status_code != 200 or len(areas) < 2:
+            return size, signed - start, 0.0, signed - start, "sign"
+
+        if self.push:
+            response = session.post(
+                self.sender.url + "/push",
+                data={"filename": filename, "algorithm": self.algorithm},
+                headers={"Accept": "application/json"},
+            )
+            verified = response.status_code == 200 and all(r["verified"] for r in response.json()["results"])
+        else:
+            response = session.post(
+                self.receiver.url + "/receive",
+                files={"file": (filename, data)},
+                data={"signature": areas[0], "pubkey": areas[1]},
+            )
+            verified = response.status_code == 200 and VERIFIED_RE.search(response.text) is not None
+        done = time.perf_counter()
+        error = None if verified else "verify"
+        return size, signed - start, done - signed, done - start, error
+
+    def _worker(self, deadline):
+        while not self._stop.is_set() and time.monotonic() < deadline:
+            cycle_id = self._next_id()
+            if cycle_id is None:
+                return
+            try:
+                result = self.run_cycle(cycle_id)
+            except requests.RequestException:
+                result = (0, 0.0, 0.0, 0.0, "connection")
+            with self._lock:
+                self.results.append(result)
+
+    def _sample_rss(self, started):
+        while not self._stop.wait(self.sample_interval):
+            self.rss_samples.append((
+                time.monotonic() - started,
+                rss_kb(self.sender.process.pid),
+                rss_kb(self.receiver.process.pid),
+            ))
+
+    def run(self):
+        started = time.monotonic()
+        deadline = started + self.duration if self.duration else float("inf")
+        sampler = threading.Thread(target=self._sample_rss, args=(started,), daemon=True)
+        sampler.start()
+        try:
+            with ThreadPoolExecutor(max_workers=self.clients) as pool:
+                for _ in range(self.clients):
+                    pool.submit(self._worker, deadline)
+        finally:
+            self._stop.set()
+            sampler.join()
+        return self.report(time.monotonic() - started)
+
+    def report(self, elapsed):
+        ok = [r for r in self.results if r[4] is None]
+        errors = {}
+        for r in self.results:
+            if r[4] is not None:
+                errors[r[4]] = errors.get(r[4], 0) + 1
+
+        def latency(values):
+            return {
+                "p50_ms": percentile(values, 50) * 1000,
+                "p95_ms": percentile(values, 95) * 1000,
+                "p99_ms": percentile(values, 99) * 1000,
+                "max_ms": max(values, default=0.0) * 1000,
+            }
+
+        return {
+            "elapsed_s": elapsed,
+            "clients": self.clients,
+            "cycles": len(self.results),
+            "throughput_cycles_s": len(self.results) / elapsed if elapsed else 0.0,
+            "throughput_mb_s": sum(r[0] for r in ok) / (1024 ** 2) / elapsed if elapsed else 0.0,
+            "error_rate": (len(self.results) - len(ok)) / len(self.results) if self.results else 0.0,
+            "errors": errors,
+            "latency_total": latency([r[3] for r in ok]),
+            "latency_sign": latency([r[1] for r in ok]),
+            "latency_verify": latency([r[2] for r in ok]),
+            "rss_kb": [{"t": t, "sender": s, "receiver": r} for t, s, r in self.rss_samples],
+        }
+
+
+def print_report(report):
+    print(f"Thời gian: {report['elapsed_s']:.1f}s, clients: {report['clients']}, chu trình: {report['cycles']}")
+    print(f"Thông lượng: {report['throughput_cycles_s']:.1f} chu trình/s, {report['throughput_mb_s']:.2f} MB/s")
+    print(f"Tỉ lệ lỗi: {report['error_rate'] * 100:.2f}% {report['errors'] or ''}")
+    for name in ("total", "sign", "verify"):
+        lat = report[f"latency_{name}"]
+        print(f"Độ trễ {name:<6}: p50 {lat['p50_ms']:.1f}ms  p95 {lat['p95_ms']:.1f}ms  "
+              f"p99 {lat['p99_ms']:.1f}ms  max {lat['max_ms']:.1f}ms")
+    print("RSS theo thời gian (KB):")
+    for sample in report["rss_kb"]:
+        print(f"  t={sample['t']:6.1f}s  A (gửi): {sample['sender']}  B (nhận): {sample['receiver']}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Kiểm thử tải luồng ký -> truyền -> xác minh giữa máy A và máy B.")
+    parser.add_argument("--clients", type=int, default=4, help="Số client chạy đồng thời.")
+    parser.add_argument("--duration", type=float, default=30.0, help="Thời gian chạy (giây); 0 = chạy đến khi đủ --cycles.")
+    parser.add_argument("--cycles", type=int, default=None, help="Tổng số chu trình tối đa.")
+    parser.add_argument("--sizes", type=parse_size_distribution, default=parse_size_distribution("1K:5,64K:3,1M:1"),
+                        help="Phân bố kích thước file, dạng kích_thước:trọng_số (ví dụ 1K:5,64K:3,1M:1).")
+    parser.add_argument("--algorithm", default="rsa-pkcs1v15",
+                        choices=["rsa-pkcs1v15", "rsa-pss", "ecdsa-p256", "ed25519"], help="Thuật toán ký.")
+    parser.add_argument("--push", action="store_true",
+                        help="Chuyển file bằng /push của máy A (truyền trực tiếp A -> B) thay vì client tải lên B.")
+    parser.add_argument("--sender-port", type=int, default=5001, help="Cổng của instance gửi (máy A).")
+    parser.add_argument("--receiver-port", type=int, default=5002, help="Cổng của instance nhận (máy B).")
+    parser.add_argument("--sample-interval", type=float, default=1.0, help="Chu kỳ lấy mẫu RSS (giây).")
+    parser.add_argument("--json", dest="json_path", help="Ghi báo cáo dạng JSON ra file này.")
+    args = parser.parse_args(argv)
+    if not args.duration and args.cycles is None:
+        parser.error("Cần --duration > 0 hoặc --cycles.")
+
+    # Ở chế độ --push, máy B chỉ tin khóa tra được từ thư mục khóa /keys của máy A
+    receiver = Instance("B", args.receiver_port,
+                        env={"KEY_DIRECTORY_URL": f"http://127.0.0.1:{args.sender_port}/keys"} if args.push else None)
+    sender = Instance("A", args.sender_port, env={"RECEIVER_URL": receiver.url} if args.push else None)
+    try:
+        sender.start()
+        receiver.start()
+        test = LoadTest(sender, receiver, args.sizes, args.clients, args.duration, args.cycles,
+                        args.sample_interval, args.algorithm, args.push)
+        report = test.run()
+    finally:
+        sender.stop()
+        receiver.stop()
+
+    print_report(report)
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    return 1 if report["error_rate"] > 0 else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,256 @@
+import os
+import re
+import json
+import mmap
+import time
+import queue
+import struct
+import threading
+
+# Mỗi mục chỉ mục: 8 byte đầu của digest + vị trí (offset) bản ghi trong segment log
+INDEX_ENTRY = struct.Struct("<8sQ")
+SEGMENT_RE = re.compile(r"segment-(\d{6})\.log$")
+
+
+class AuditLog:
+    """
+    Nhật ký kiểm toán chỉ ghi thêm (append-only) cho các sự kiện ký/xác minh.
+
+    - Mỗi bản ghi là một dòng JSON trong segment-NNNNNN.log, kèm chỉ mục nhị phân
+      segment-NNNNNN.idx (theo thứ tự ghi) để tra cứu theo digest.
+    - Khi một segment được đóng lại (xoay vòng), chỉ mục của nó được sắp xếp thành segment-NNNNNN.sidx
+      và tra cứu bằng tìm kiếm nhị phân; segment đang ghi được tra qua bảng prefix -> offset trong bộ nhớ
+      (bộ nhớ tỉ lệ với số bản ghi của một segment, giới hạn bởi segment_max_bytes).
+    - Group commit: một luồng ghi gom mọi bản ghi đang chờ, ghi một lượt rồi fsync một lần;
+      record() chỉ trả về sau khi bản ghi đã được fsync.
+    - Segment được xoay vòng khi vượt quá segment_max_bytes.
+    - Mỗi tiến trình cần một thư mục riêng: hai tiến trình ghi chung một segment sẽ làm sai offset của nhau.
+    """
+
+    def __init__(self, directory="audit", segment_max_bytes=64 * 1024 * 1024, commit_delay=0.0, max_batch=1024):
+        self.directory = directory
+        self.segment_max_bytes = segment_max_bytes
+        self.commit_delay = commit_delay
+        self.max_batch = max_batch
+        self.batches = 0
+        self.records = 0
+        self._queue = queue.Queue()
+        # Bảo vệ _segment và _active_offsets, được đọc bởi lookup() từ các luồng request
+        self._index_lock = threading.Lock()
+        self._active_offsets = {}
+        os.makedirs(directory, exist_ok=True)
+
+        segments = self._segments()
+        self._segment = segments[-1] if segments else 1
+        self._open_segment()
+        self._recover()
+        # Segment đã đóng nhưng chưa có chỉ mục sắp xếp (ví dụ dừng ngay khi xoay vòng, hoặc dữ liệu cũ)
+        for segment in segments[:-1]:
+            if not os.path.exists(self._sorted_index_path(segment)):
+                self._seal_from_index(segment)
+
+        self._thread = threading.Thread(target=self._run, name="audit-log-writer", daemon=True)
+        self._thread.start()
+
+    @classmethod
+    def from_env(cls, default_directory="audit"):
+        return cls(
+            directory=os.environ.get("AUDIT_DIR", default_directory),
+            segment_max_bytes=int(os.environ.get("AUDIT_SEGMENT_MB", "64")) * 1024 * 1024,
+            commit_delay=float(os.environ.get("AUDIT_COMMIT_DELAY_MS", "0")) / 1000,
+        )
+
+    def record(self, event, digest: bytes, key_id, result, **extra):
+        """
+        Ghi một sự kiện (sign / verify) và chờ đến khi nó đã được fsync xuống đĩa.
+        """
+        entry = {
+            "ts": time.time(),
+            "event": event,
+            "digest": digest.hex(),
+            "key_id": key_id,
+            "result": result,
+        }
+        entry.update(extra)
+        line = (json.dumps(entry, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8")
+        done = threading.Event()
+        pending = [line, digest, done, None]
+        self._queue.put(pending)
+        done.wait()
+        if pending[3] is not None:
+            raise pending[3]
+
+    def lookup(self, digest: bytes):
+        """
+        Tất cả bản ghi của một digest, theo thứ tự thời gian.
+        """
+        prefix = digest[:8]
+        with self._index_lock:
+            active = self._segment
+            active_offsets = list(self._active_offsets.get(prefix, ()))
+        found = []
+        for segment in self._segments():
+            if segment > active:
+                continue
+            offsets = active_offsets if segment == active else self._sealed_offsets(segment, prefix)
+            if not offsets:
+                continue
+            _, log_path = self._paths(segment)
+            with open(log_path, "rb") as f:
+                for offset in offsets:
+                    f.seek(offset)
+                    entry = json.loads(f.readline())
+                    if entry["digest"] == digest.hex():
+                        found.append(entry)
+        return found
+
+    def stats(self):
+        return {
+            "segment": self._segment,
+            "records": self.records,
+            "batches": self.batches,
+            "records_per_fsync": (self.records / self.batches) if self.batches else 0.0,
+        }
+
+    def _segments(self):
+        return sorted(int(m.group(1)) for m in map(SEGMENT_RE.match, os.listdir(self.directory)) if m)
+
+    def _paths(self, segment):
+        base = os.path.join(self.directory, f"segment-{segment:06d}")
+        return base + ".idx", base + ".log"
+
+    def _sorted_index_path(self, segment):
+        return os.path.join(self.directory, f"segment-{segment:06d}.sidx")
+
+    def _sealed_offsets(self, segment, prefix):
+        """
+        Tìm kiếm nhị phân trên chỉ mục đã sắp xếp của một segment đã đóng.
+        """
+        try:
+            f = open(self._sorted_index_path(segment), "rb")
+        except FileNotFoundError:
+            return []
+        with f:
+            count = os.fstat(f.fileno()).st_size // INDEX_ENTRY.size
+            if not count:
+                return []
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as index:
+                low, high = 0, count
+                while low < high:
+                    middle = (low + high) // 2
+                    position = middle * INDEX_ENTRY.size
+                    if index[position:position + 8] < prefix:
+                        low = middle + 1
+                    else:
+                        high = middle
+                offsets = []
+                while low < count:
+                    key, offset = INDEX_ENTRY.unpack_from(index, low * INDEX_ENTRY.size)
+                    if key != prefix:
+                        break
+                    offsets.append(offset)
+                    low += 1
+                return offsets
+
+    def _write_sorted_index(self, segment, entries):
+        path = self._sorted_index_path(segment)
+        with open(path + ".tmp", "wb") as f:
+            f.write(b"".join(INDEX_ENTRY.pack(key, offset) for key, offset in sorted(entries)))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + ".tmp", path)
+
+    def _seal_from_index(self, segment):
+        index_path, _ = self._paths(segment)
+        with open(index_path, "rb") as f:
+            index = f.read()
+        self._write_sorted_index(segment, INDEX_ENTRY.iter_unpack(index[:len(index) - len(index) % INDEX_ENTRY.size]))
+
+    def _open_segment(self):
+        index_path, log_path = self._paths(self._segment)
+        self._log = open(log_path, "ab")
+        self._index = open(index_path, "ab")
+        # fsync thư mục để mục nhập của segment mới cũng bền vững (không áp dụng được trên Windows)
+        if hasattr(os, "O_DIRECTORY"):
+            fd = os.open(self.directory, os.O_RDONLY | os.O_DIRECTORY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+
+    def _recover(self):
+        """
+        Sau khi bị dừng đột ngột: cắt bỏ dòng ghi dở ở cuối log và bổ sung chỉ mục còn thiếu.
+        """
+        index_path, log_path = self._paths(self._segment)
+        with open(log_path, "rb") as f:
+            data = f.read()
+        end = data.rfind(b"\n") + 1
+        if end != len(data):
+            self._log.truncate(end)
+            self._log.seek(0, os.SEEK_END)
+        index_size = os.path.getsize(index_path)
+        if index_size % INDEX_ENTRY.size:
+            self._index.truncate(index_size - index_size % INDEX_ENTRY.size)
+        with open(index_path, "rb") as f:
+            index = f.read()
+        for key, offset in INDEX_ENTRY.iter_unpack(index):
+            self._active_offsets.setdefault(key, []).append(offset)
+        indexed = len(index) // INDEX_ENTRY.size
+        offset, count = 0, 0
+        for line in data[:end].splitlines(keepends=True):
+            if count >= indexed:
+                prefix = bytes.fromhex(json.loads(line)["digest"])[:8]
+                self._index.write(INDEX_ENTRY.pack(prefix, offset))
+                self._active_offsets.setdefault(prefix, []).append(offset)
+            offset += len(line)
+            count += 1
+        self._index.flush()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            if self.commit_delay:
+                time.sleep(self.commit_delay)
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._write_batch(batch)
+            except Exception as e:
+                for pending in batch:
+                    pending[3] = e
+            for pending in batch:
+                pending[2].set()
+
+    def _write_batch(self, batch):
+        offset = self._log.tell()
+        entries = []
+        for line, digest, _, _ in batch:
+            entries.append((digest[:8], offset))
+            offset += len(line)
+        self._log.write(b"".join(pending[0] for pending in batch))
+        self._log.flush()
+        os.fsync(self._log.fileno())
+        # Chỉ mục của segment đang ghi có thể dựng lại từ log (_recover) nên không cần fsync mỗi lô
+        self._index.write(b"".join(INDEX_ENTRY.pack(key, entry_offset) for key, entry_offset in entries))
+        self._index.flush()
+        with self._index_lock:
+            for key, entry_offset in entries:
+                self._active_offsets.setdefault(key, []).append(entry_offset)
+        self.batches += 1
+        self.records += len(batch)
+        if offset >= self.segment_max_bytes:
+            # _recover chỉ xử lý segment cuối, nên chỉ mục phải bền vững trước khi chuyển sang segment mới
+            os.fsync(self._index.fileno())
+            self._write_sorted_index(self._segment, (
+                (key, entry_offset) for key, offsets in self._active_offsets.items() for entry_offset in offsets
+            ))
+            self._log.close()
+            self._index.close()
+            with self._index_lock:
+                self._segment += 1
+                self._active_offsets = {}
+            self._open_segment()
@@ -0,0 +1,199 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+from collections import namedtuple
+
+import requests
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa, ec, ed25519
+
+logger = logging.getLogger(__name__)
+
+KeyEntry = namedtuple("KeyEntry", "kid fingerprint algorithms pem public_key source")
+
+# Nguồn của khóa: của chính máy này (được công bố), được cấu hình tin cậy sẵn, hoặc nạp từ thư mục khóa
+SOURCE_LOCAL = "local"
+SOURCE_TRUSTED = "trusted"
+SOURCE_REMOTE = "remote"
+
+
+def pem_fingerprint(pem):
+    """
+    SHA-256 của nội dung PEM đã bỏ khoảng trắng; key ID là 16 ký tự hex đầu.
+    """
+    return hashlib.sha256("".join(pem.split()).encode()).hexdigest()
+
+
+def key_type(public_key):
+    if isinstance(public_key, rsa.RSAPublicKey):
+        return "RSA"
+    if isinstance(public_key, ec.EllipticCurvePublicKey):
+        return "EC"
+    if isinstance(public_key, ed25519.Ed25519PublicKey):
+        return "OKP"
+    return "unknown"
+
+
+class KeyDirectory:
+    """
+    Thư mục public key theo key ID (kiểu JWKS).
+
+    - Khóa của chính máy này (add_local) được công bố qua document(): JSON cố định kèm ETag mạnh.
+    - Khóa tin cậy cấu hình sẵn (add_trusted) chỉ dùng để xác minh, không được công bố.
+    - Khóa của máy khác được nạp từ url (KEY_DIRECTORY_URL), lưu sẵn đối tượng key đã parse;
+      khi hết max-age hoặc gặp key ID lạ thì kiểm tra lại bằng If-None-Match (304 thì giữ nguyên).
+    - Key ID lạ chỉ kích hoạt tải lại tối đa một lần mỗi min_refresh_interval giây.
+    """
+
+    def __init__(self, url="", max_age=300.0, min_refresh_interval=30.0, timeout=5.0):
+        self.url = url
+        self.max_age = max_age
+        self.min_refresh_interval = min_refresh_interval
+        self.timeout = timeout
+        self.fetches = 0
+        self.not_modified = 0
+        self.fetch_errors = 0
+        self._entries = {}
+        self._etag = None
+        self._expires = 0.0
+        self._last_fetch = float("-inf")
+        self._document = None
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._session = requests.Session()
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            url=os.environ.get("KEY_DIRECTORY_URL", ""),
+            max_age=float(os.environ.get("KEY_DIRECTORY_MAX_AGE", "300")),
+        )
+
+    def add_local(self, pem, algorithm):
+        """
+        Đăng ký public key của máy này cho một thuật toán; trả về key ID.
+        """
+        return self._add(pem, (algorithm,), SOURCE_LOCAL)
+
+    def add_trusted(self, pem, algorithms):
+        """
+        Đăng ký public key của máy gửi được tin cậy sẵn (ví dụ đọc từ TRUSTED_KEYS_FILE); trả về key ID.
+        """
+        return self._add(pem, tuple(algorithms), SOURCE_TRUSTED)
+
+    def _add(self, pem, algorithms, source):
+        fingerprint = pem_fingerprint(pem)
+        kid = fingerprint[:16]
+        with self._lock:
+            entry = self._entries.get(kid)
+            if entry is not None and entry.source == source:
+                added = tuple(a for a in algorithms if a not in entry.algorithms)
+                self._entries[kid] = entry._replace(algorithms=entry.algorithms + added)
+            else:
+                public_key = serialization.load_pem_public_key(pem.encode())
+                self._entries[kid] = KeyEntry(kid, fingerprint, algorithms, pem, public_key, source)
+            self._document = None
+        return kid
+
+    def document(self):
+        """
+        (body JSON, ETag) của các khóa cục bộ; chỉ tạo lại khi danh sách khóa thay đổi.
+        """
+        with self._lock:
+            if self._document is None:
+                keys = [
+                    {"kid": e.kid, "kty": key_type(e.public_key), "algorithms": list(e.algorithms), "pem": e.pem}
+                    for e in sorted(self._entries.values(), key=lambda e: e.kid) if e.source == SOURCE_LOCAL
+                ]
+                body = json.dumps({"keys": keys}, ensure_ascii=False, sort_keys=True, separators=(",", ":")).encode()
+                self._document = (body, hashlib.sha256(body).hexdigest()[:32])
+            return self._document
+
+    def resolve(self, kid):
+        """
+        KeyEntry của key ID, hoặc None nếu không tìm thấy (kể cả sau khi đã hỏi lại thư mục).
+        """
+        with self._lock:
+            entry = self._entries.get(kid)
+            fresh = time.monotonic() < self._expires
+        if entry is not None and (entry.source != SOURCE_REMOTE or fresh or not self.url):
+            return entry
+        if self.url:
+            self._refresh(force=entry is None)
+        with self._lock:
+            return self._entries.get(kid)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "local_keys": sum(1 for e in self._entries.values() if e.source == SOURCE_LOCAL),
+                "trusted_keys": sum(1 for e in self._entries.values() if e.source == SOURCE_TRUSTED),
+                "remote_keys": sum(1 for e in self._entries.values() if e.source == SOURCE_REMOTE),
+                "url": self.url,
+                "etag": self._etag,
+                "fetches": self.fetches,
+                "not_modified": self.not_modified,
+                "fetch_errors": self.fetch_errors,
+            }
+
+    def _refresh(self, force):
+        with self._refresh_lock:
+            now = time.monotonic()
+            if force:
+                if now - self._last_fetch < self.min_refresh_interval:
+                    return
+            elif now < self._expires:
+                return  # luồng khác vừa kiểm tra lại xong trong lúc chờ khóa
+            self._last_fetch = now
+            headers = {"If-None-Match": f'"{self._etag}"'} if self._etag else {}
+            try:
+                response = self._session.get(self.url, headers=headers, timeout=self.timeout)
+                if response.status_code == 304:
+                    with self._lock:
+                        self.not_modified += 1
+                        self._expires = now + self._max_age(response)
+                    return
+                response.raise_for_status()
+                remote = self._parse(response.json())
+            except Exception as e:
+                # Giữ khóa đã nạp trước đó (stale-if-error) và chỉ thử lại sau min_refresh_interval,
+                # để thư mục khóa không truy cập được không làm mỗi lần xác minh phải chờ timeout
+                with self._lock:
+                    self.fetch_errors += 1
+                    self._expires = now + self.min_refresh_interval
+                logger.warning("Không tải được thư mục khóa %s: %s", self.url, e)
+                return
+            with self._lock:
+                self.fetches += 1
+                self._entries = {kid: e for kid, e in self._entries.items() if e.source != SOURCE_REMOTE}
+                for kid, entry in remote.items():
+                    self._entries.setdefault(kid, entry)
+                self._etag = response.headers.get("ETag", "").removeprefix("W/").strip('"') or None
+                self._expires = now + self._max_age(response)
+
+    def _parse(self, document):
+        with self._lock:
+            known = dict(self._entries)
+        remote = {}
+        for item in document.get("keys", []):
+            pem = item["pem"]
+            fingerprint = pem_fingerprint(pem)
+            kid = fingerprint[:16]
+            if item.get("kid") != kid:
+                # Không tin key ID do máy khác khai báo nếu nó không khớp với chính PEM
+                logger.warning("Bỏ qua khóa có kid %r không khớp với PEM", item.get("kid"))
+                continue
+            previous = known.get(kid)
+            public_key = previous.public_key if previous is not None else serialization.load_pem_public_key(pem.encode())
+            remote[kid] = KeyEntry(kid, fingerprint, tuple(item.get("algorithms", ())), pem, public_key, SOURCE_REMOTE)
+        return remote
+
+    def _max_age(self, response):
+        for directive in response.headers.get("Cache-Control", "").split(","):
+            name, _, value = directive.strip().partition("=")
+            if name.lower() == "max-age" and value.isdigit():
+                return float(value)
+        return self.max_age